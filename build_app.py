@@ -52,9 +52,8 @@ def main():
     print("\n🧹 Очистка предыдущих сборок...")
     dirs_to_clean = ["build", "dist", "__pycache__"]
     for dir_name in dirs_to_clean:
-        if Path(dir_name).exists():
-            shutil.rmtree(dir_name)
-            print(f"Удалена папка: {dir_name}")
+        shutil.rmtree(dir_name, ignore_errors=True)
+    print(f"Удалены папки (если существовали): {', '.join(dirs_to_clean)}")
     
     # Собираем приложение
     if not run_command([
@@ -74,8 +73,10 @@ def main():
         # Создаем архив для распространения
         print("\n📦 Создание архива для распространения...")
         archive_name = "Roland_SP404_Automation_macOS.zip"
+        # -0: без сжатия. Содержимое .app (Mach-O, dylib, сжатые ресурсы)
+        # почти не сжимается, а DEFLATE тратит на него основное время
         if run_command([
-            "zip", "-r", archive_name, 
+            "zip", "-r", "-0", archive_name, 
             str(app_path)
         ], "Создание архива"):
             print(f"✅ Архив создан: {archive_name}")
@@ -93,14 +94,16 @@ def main():
 
 def get_folder_size(folder_path):
     """Возвращает размер папки в удобном формате"""
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            if os.path.exists(filepath):
-                total_size += os.path.getsize(filepath)
-    
-    return format_size(total_size)
+    return format_size(sum(_iter_file_sizes(folder_path)))
+
+def _iter_file_sizes(folder_path):
+    """Рекурсивно перечисляет размеры файлов через os.scandir (без лишних stat)"""
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_file_sizes(entry.path)
+            elif entry.is_file():
+                yield entry.stat().st_size
 
 def get_file_size(file_path):
     """Возвращает размер файла в удобном формате"""
@@ -5,29 +5,26 @@
 
 import numpy as np
 import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 def create_test_wav(filename: str, sample_rate: int = 48000, duration: float = 1.0, channels: int = 1):
     """Создает тестовый WAV файл с синусоидальным сигналом"""
-    # Генерируем синусоидальный сигнал 440 Hz (нота A)
+    # Генерируем синусоидальные сигналы для всех каналов одним вызовом:
+    # левый канал - 440 Hz (нота A), правый - 880 Hz (октава выше)
     t = np.linspace(0, duration, int(sample_rate * duration), False)
-    frequency = 440.0  # Hz
-    signal = np.sin(2 * np.pi * frequency * t)
+    frequencies = np.array([440.0, 880.0])[:channels]  # Hz
+    phases = 2 * np.pi * frequencies[:, np.newaxis] * t[np.newaxis, :]
+    signal = np.sin(phases, out=phases)
     
-    # Добавляем небольшой шум для реалистичности
-    noise = np.random.normal(0, 0.1, signal.shape)
-    signal = signal + noise
+    # Добавляем небольшой шум в первый канал для реалистичности
+    signal[0] += np.random.normal(0, 0.1, t.shape)
     
-    # Нормализуем
-    signal = signal / np.max(np.abs(signal)) * 0.8
+    # Нормализуем каждый канал отдельно
+    signal *= 0.8 / np.max(np.abs(signal), axis=1, keepdims=True)
     
-    # Создаем стерео, если нужно
-    if channels == 2:
-        # Левый канал - 440 Hz, правый канал - 880 Hz
-        left_channel = signal
-        right_channel = np.sin(2 * np.pi * 880.0 * t)  # Октава выше
-        right_channel = right_channel / np.max(np.abs(right_channel)) * 0.8
-        signal = np.column_stack((left_channel, right_channel))
+    # soundfile ожидает массив [отсчеты, каналы] (или одномерный для моно)
+    signal = signal.T if channels == 2 else signal[0]
     
     # Сохраняем как WAV
     sf.write(filename, signal, sample_rate, subtype='PCM_16')
@@ -44,9 +41,13 @@ def main():
         ("test_samples/Test_Folder_3/Another_Test.wav", 48000, 0.9, 2),  # стерео
     ]
     
-    for filename, sample_rate, duration, channels in test_files:
+    for filename, _, _, _ in test_files:
         Path(filename).parent.mkdir(parents=True, exist_ok=True)
-        create_test_wav(filename, sample_rate, duration, channels)
+    
+    # Файлы независимы друг от друга; numpy и soundfile отпускают GIL,
+    # поэтому пула потоков достаточно
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(create_test_wav, *zip(*test_files)))
     
     print("\nВсе тестовые файлы созданы!")
 
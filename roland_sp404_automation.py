@@ -10,24 +10,32 @@ Roland SP-404 MKII File Automation Script
 
 Требования:
 - Python 3.7+
-- pysmb (для работы с SMB)
-- pydub (для конвертации аудио)
+- smbprotocol (для работы с SMB)
+- soundfile, scipy, numpy (для конвертации аудио)
+- sox (опционально, для быстрой конвертации)
 - pathlib, os, re (стандартные библиотеки)
 """
 
+import io
 import os
+import functools
 import re
+import math
 import shutil
 import logging
+import subprocess
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import BinaryIO, Dict, List, Tuple, Optional, Union
 import unicodedata
 
 try:
-    from smb.SMBConnection import SMBConnection
-    from smb.smb_structs import OperationFailure
+    import smbclient
 except ImportError:
-    print("Ошибка: Не установлен pysmb. Установите: pip install pysmb")
+    print("Ошибка: Не установлен smbprotocol. Установите: pip install smbprotocol")
     exit(1)
 
 try:
@@ -38,6 +46,119 @@ except ImportError:
     print("Ошибка: Не установлены soundfile и scipy. Установите: pip install soundfile scipy")
     exit(1)
 
+# Опционально: soxr дает более быстрый ресэмплинг, чем scipy
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+# Опционально: libsamplerate (SRC_SINC_FASTEST) быстрее scipy, если нет soxr
+try:
+    import samplerate
+except ImportError:
+    samplerate = None
+
+# Опционально: numba компилирует ядра нормализации в один проход по данным
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _mono_peak(frames):
+        """Возвращает пиковую амплитуду моно-микса кадров (frames: [N, каналы])"""
+        peak = 0.0
+        channels = frames.shape[1]
+        for i in range(frames.shape[0]):
+            total = 0.0
+            for c in range(channels):
+                total += frames[i, c]
+            value = abs(total / channels)
+            if value > peak:
+                peak = value
+        return peak
+
+    @njit(cache=True, fastmath=True)
+    def _to_int16(mono, scale):
+        """Масштабирует моно-сигнал и переводит его в int16 с ограничением диапазона"""
+        out = np.empty(mono.shape[0], dtype=np.int16)
+        for i in range(mono.shape[0]):
+            value = mono[i] * scale
+            if value > 32767.0:
+                value = 32767.0
+            elif value < -32768.0:
+                value = -32768.0
+            out[i] = np.int16(value)
+        return out
+else:
+    def _mono_peak(frames):
+        """Возвращает пиковую амплитуду моно-микса кадров (frames: [N, каналы])"""
+        if frames.shape[0] == 0:
+            return 0.0
+        mono = frames.mean(axis=1, dtype=np.float32)
+        return float(np.abs(mono, out=mono).max())
+
+    def _to_int16(mono, scale):
+        """Масштабирует моно-сигнал и переводит его в int16 с ограничением диапазона"""
+        # Один временный float32 буфер: умножение и ограничение выполняются на месте
+        scaled = np.multiply(mono, scale, dtype=np.float32)
+        np.clip(scaled, -32768, 32767, out=scaled)
+        out = np.empty(scaled.shape, dtype=np.int16)
+        np.copyto(out, scaled, casting='unsafe')
+        return out
+
+# Размер блока (в кадрах) для потоковой конвертации
+BLOCK_SIZE = 65536
+
+# Размер блока чтения (в байтах) при скачивании с SMB
+SMB_READ_SIZE = 1 << 20
+
+# Файлы до этого размера скачиваются с SMB в память, а не во временный файл
+IN_MEMORY_DOWNLOAD_LIMIT = 10 * 1024 * 1024
+
+# Таблицы и регулярное выражение для normalize_name строятся один раз
+_ASCII_TABLE = bytes.maketrans(b' ', b'_')
+_ASCII_DELETE = bytes(c for c in range(256)
+                      if not (chr(c).isascii() and chr(c).isalnum()) and chr(c) not in '_ ')
+_RE_MULTI_UNDERSCORE = re.compile(r'_+')
+
+
+@functools.lru_cache(maxsize=None)
+def _poly_fir(up: int, down: int) -> "np.ndarray":
+    """
+    Возвращает ФНЧ для resample_poly с заданными коэффициентами
+    
+    Фильтр совпадает с тем, что resample_poly строит сам (Kaiser, beta=5.0),
+    но проектируется один раз на пару (up, down), а не при каждом вызове.
+    
+    Args:
+        up: Коэффициент интерполяции
+        down: Коэффициент децимации
+        
+    Returns:
+        Коэффициенты FIR фильтра (float32)
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    fir = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    return fir.astype(np.float32)
+
+
+@functools.lru_cache(maxsize=None)
+def _src_resampler() -> "samplerate.Resampler":
+    """
+    Возвращает ресэмплер libsamplerate, общий для всех файлов процесса
+    
+    Состояние ресэмплера выделяется один раз; перед каждым файлом его
+    нужно сбрасывать методом reset().
+    
+    Returns:
+        Моно-ресэмплер samplerate с конвертером sinc_fastest
+    """
+    return samplerate.Resampler('sinc_fastest', channels=1)
+
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -70,31 +191,41 @@ class RolandSP404Automation:
         self.supported_sample_rates = [44100, 48000]
         self.supported_bit_depths = [16, 24]
         
-    def normalize_name(self, name: str) -> str:
+        # Внешний конвертер sox (если установлен) работает быстрее scipy
+        self.sox_path = shutil.which("sox")
+        
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def normalize_name(name: str) -> str:
         """
         Нормализует название файла или папки для SP-404 MKII
         
+        Результат зависит только от name, поэтому кэшируется: одинаковые
+        имена папок и файлов в дереве нормализуются один раз.
+        
         Args:
             name: Исходное название
             
         Returns:
             Нормализованное название (только латиница, цифры, подчеркивания)
         """
-        # Удаляем расширение для обработки
-        name_without_ext = Path(name).stem
-        extension = Path(name).suffix.lower()
-        
-        # Нормализуем Unicode символы
-        normalized = unicodedata.normalize('NFKD', name_without_ext)
+        # Удаляем расширение для обработки. Разбиваем строку напрямую, без
+        # создания объектов Path, но по тем же правилам, что Path.stem/suffix
+        dot = name.rfind('.')
+        if 0 < dot < len(name) - 1:
+            name_without_ext, extension = name[:dot], name[dot:].lower()
+        else:
+            name_without_ext, extension = name, ''
         
-        # Заменяем пробелы на подчеркивания
-        normalized = normalized.replace(' ', '_')
+        # Нормализуем Unicode символы и отбрасываем все, что не вошло в ASCII
+        normalized = unicodedata.normalize('NFKD', name_without_ext).encode('ascii', 'ignore')
         
-        # Удаляем все символы кроме латиницы, цифр и подчеркиваний
-        normalized = re.sub(r'[^a-zA-Z0-9_]', '', normalized)
+        # Одним проходом по таблице заменяем пробелы на подчеркивания
+        # и удаляем все символы кроме латиницы, цифр и подчеркиваний
+        normalized = normalized.translate(_ASCII_TABLE, _ASCII_DELETE).decode('ascii')
         
         # Удаляем множественные подчеркивания
-        normalized = re.sub(r'_+', '_', normalized)
+        normalized = _RE_MULTI_UNDERSCORE.sub('_', normalized)
         
         # Удаляем подчеркивания в начале и конце
         normalized = normalized.strip('_')
@@ -105,6 +236,39 @@ class RolandSP404Automation:
             
         return normalized + extension
     
+    def unique_name(self, name: str, used_names: Dict[str, int]) -> str:
+        """
+        Возвращает имя, не совпадающее с уже выданными в той же папке
+        
+        Имена сравниваются без учета регистра: файловые системы SD карт
+        (FAT32/exFAT) его не различают. При совпадении к имени добавляется
+        номер (_001, _002, ...), поэтому результат зависит только от порядка
+        элементов, а не от успеха конвертации.
+        
+        Args:
+            name: Нормализованное имя
+            used_names: Выданные имена в нижнем регистре -> последний номер,
+                        добавленный к этому имени (дополняется на месте)
+            
+        Returns:
+            Уникальное в пределах папки имя
+        """
+        key = name.lower()
+        if key not in used_names:
+            used_names[key] = 0
+            return name
+        
+        stem, extension = os.path.splitext(name)
+        counter = used_names[key]
+        while True:
+            counter += 1
+            candidate = f"{stem}_{counter:03d}{extension}"
+            if candidate.lower() not in used_names:
+                break
+        used_names[key] = counter
+        used_names[candidate.lower()] = 0
+        return candidate
+    
     def connect_smb(self) -> bool:
         """
         Подключается к SMB серверу
@@ -113,21 +277,19 @@ class RolandSP404Automation:
             True если подключение успешно, False иначе
         """
         try:
-            self.conn = SMBConnection(
-                self.smb_username, 
-                self.smb_password, 
-                "roland_automation", 
-                "server", 
-                use_ntlm_v2=True
+            # Гостевая сессия не имеет ключа сессии, поэтому подпись для нее отключаем
+            self.conn = smbclient.register_session(
+                self.smb_server,
+                username=self.smb_username or "Guest",
+                password=self.smb_password,
+                port=445,
+                encrypt=False,
+                connection_timeout=60,
+                require_signing=bool(self.smb_username)
             )
             
-            result = self.conn.connect(self.smb_server, 445)
-            if result:
-                logger.info(f"Успешно подключились к SMB серверу {self.smb_server}")
-                return True
-            else:
-                logger.error(f"Не удалось подключиться к SMB серверу {self.smb_server}")
-                return False
+            logger.info(f"Успешно подключились к SMB серверу {self.smb_server}")
+            return True
                 
         except Exception as e:
             logger.error(f"Ошибка подключения к SMB: {e}")
@@ -136,10 +298,24 @@ class RolandSP404Automation:
     def disconnect_smb(self):
         """Отключается от SMB сервера"""
         if self.conn:
-            self.conn.close()
+            smbclient.delete_session(self.smb_server)
+            self.conn = None
             logger.info("Отключились от SMB сервера")
     
-    def get_smb_file_list(self, remote_path: str) -> List[Tuple[str, bool]]:
+    def unc_path(self, remote_path: str) -> str:
+        """
+        Формирует UNC путь (\\\\сервер\\шара\\путь) для smbclient
+        
+        Args:
+            remote_path: Путь на SMB сервере относительно шары
+            
+        Returns:
+            UNC путь
+        """
+        parts = [part for part in remote_path.replace('\\', '/').split('/') if part]
+        return '\\\\' + '\\'.join([self.smb_server, self.smb_share] + parts)
+    
+    def get_smb_file_list(self, remote_path: str) -> List[Tuple[str, bool, int]]:
         """
         Получает список файлов и папок с SMB сервера
         
@@ -147,13 +323,14 @@ class RolandSP404Automation:
             remote_path: Путь на SMB сервере
             
         Returns:
-            Список кортежей (имя, является_файлом)
+            Список кортежей (имя, является_файлом, размер_в_байтах)
         """
         try:
             files = []
-            for file_info in self.conn.listPath(self.smb_share, remote_path):
-                if file_info.filename not in ['.', '..']:
-                    files.append((file_info.filename, not file_info.isDirectory))
+            for entry in smbclient.scandir(self.unc_path(remote_path)):
+                if entry.name not in ['.', '..']:
+                    # Размер уже есть в ответе на листинг, отдельный stat не нужен
+                    files.append((entry.name, not entry.is_dir(), entry.smb_info.end_of_file))
             return files
         except Exception as e:
             logger.error(f"Ошибка получения списка файлов из {remote_path}: {e}")
@@ -171,111 +348,287 @@ class RolandSP404Automation:
             True если скачивание успешно, False иначе
         """
         try:
-            with open(local_path, 'wb') as local_file:
-                self.conn.retrieveFile(self.smb_share, remote_path, local_file)
+            # Читаем блоками по 1 МБ: SMB3 отдает их крупными READ-запросами
+            with smbclient.open_file(self.unc_path(remote_path), mode='rb') as remote_file, \
+                    open(local_path, 'wb') as local_file:
+                shutil.copyfileobj(remote_file, local_file, length=SMB_READ_SIZE)
             logger.info(f"Скачан файл: {remote_path} -> {local_path}")
             return True
         except Exception as e:
             logger.error(f"Ошибка скачивания файла {remote_path}: {e}")
             return False
     
-    def convert_audio_file(self, input_path: str, output_path: str) -> bool:
+    def read_smb_file(self, remote_path: str) -> Optional[bytes]:
+        """
+        Скачивает файл с SMB сервера в память
+        
+        Args:
+            remote_path: Путь к файлу на SMB сервере
+            
+        Returns:
+            Содержимое файла или None при ошибке
+        """
+        try:
+            with smbclient.open_file(self.unc_path(remote_path), mode='rb') as remote_file:
+                data = remote_file.read()
+            logger.info(f"Скачан файл в память: {remote_path}")
+            return data
+        except Exception as e:
+            logger.error(f"Ошибка скачивания файла {remote_path}: {e}")
+            return None
+    
+    def convert_audio_file(self, input_path: Union[str, BinaryIO], output_path: str) -> bool:
         """
         Конвертирует аудиофайл в формат, поддерживаемый SP-404 MKII
         
+        Если в системе установлен sox, конвертация выполняется им одним
+        вызовом; иначе используется soundfile + scipy.
+        
         Args:
-            input_path: Путь к исходному файлу
+            input_path: Путь к исходному файлу или файловый объект с его содержимым
             output_path: Путь для сохранения конвертированного файла
             
         Returns:
             True если конвертация успешна, False иначе
         """
+        source_name = getattr(input_path, 'name', input_path)
         try:
-            # Загружаем аудиофайл
-            data, sample_rate = sf.read(input_path)
-            
-            # Проверяем текущие параметры
-            current_channels = 1 if data.ndim == 1 else data.shape[1]
-            current_sample_rate = sample_rate
+            # Читаем только заголовок файла, без декодирования аудиоданных
+            info = sf.info(input_path)
+            if not isinstance(input_path, str):
+                input_path.seek(0)
+            current_channels = info.channels
+            current_sample_rate = info.samplerate
             
             logger.info(f"Исходный файл: {current_sample_rate}Hz, {current_channels}ch")
             
+            # Файл уже в формате SP-404 MKII - копируем без перекодирования
+            if (info.format == 'WAV' and info.subtype == 'PCM_16' and current_channels == 1
+                    and current_sample_rate in self.supported_sample_rates):
+                if isinstance(input_path, str):
+                    shutil.copyfile(input_path, output_path)
+                else:
+                    with open(output_path, 'wb') as output_file:
+                        shutil.copyfileobj(input_path, output_file)
+                logger.info(f"Файл уже в нужном формате, скопирован: {output_path}")
+                return True
+            
             # Выбираем ближайшую поддерживаемую частоту дискретизации
             target_sample_rate = min(self.supported_sample_rates, 
                                    key=lambda x: abs(x - current_sample_rate))
             
-            # Конвертируем частоту дискретизации если нужно
+            if self.sox_path:
+                self.convert_with_sox(input_path, output_path, target_sample_rate)
+            else:
+                self.convert_with_soundfile(input_path, output_path, target_sample_rate)
+            
             if current_sample_rate != target_sample_rate:
-                # Используем scipy для ресэмплинга
-                num_samples = int(len(data) * target_sample_rate / current_sample_rate)
-                if data.ndim == 1:
-                    data = signal.resample(data, num_samples)
-                else:
-                    data = signal.resample(data, num_samples, axis=0)
                 logger.info(f"Изменена частота дискретизации: {current_sample_rate} -> {target_sample_rate}")
-            
-            # Приводим к моно, если нужно (SP-404 MKII лучше работает с моно)
             if current_channels > 1:
-                data = np.mean(data, axis=1)
                 logger.info("Конвертировано в моно")
             
-            # Нормализуем данные для 16-bit
-            if np.max(np.abs(data)) > 0:
-                data = data / np.max(np.abs(data)) * 0.95  # Оставляем небольшой запас
-            
-            # Конвертируем в 16-bit
-            data_16bit = (data * 32767).astype(np.int16)
-            
-            # Сохраняем как WAV файл
-            sf.write(output_path, data_16bit, target_sample_rate, subtype='PCM_16')
             logger.info(f"Файл конвертирован: {output_path}")
             return True
             
         except Exception as e:
-            logger.error(f"Ошибка конвертации файла {input_path}: {e}")
+            logger.error(f"Ошибка конвертации файла {source_name}: {e}")
             return False
     
-    def process_directory(self, remote_path: str, local_base_path: str, sd_card_path: str):
+    def convert_with_sox(self, input_path: Union[str, BinaryIO], output_path: str,
+                         target_sample_rate: int):
         """
-        Обрабатывает директорию рекурсивно
+        Конвертирует файл через sox: моно, 16-bit, нормализация пика до -0.45 dB (~0.95)
+        
+        Args:
+            input_path: Путь к исходному файлу или файловый объект (передается через stdin)
+            output_path: Путь для сохранения конвертированного файла
+            target_sample_rate: Целевая частота дискретизации
+        """
+        if isinstance(input_path, str):
+            source_args, stdin_data = [input_path], None
+        else:
+            source_args, stdin_data = ["-t", "wav", "-"], input_path.read()
+        
+        cmd = [
+            self.sox_path, *source_args,
+            "-b", "16", output_path,
+            "channels", "1",
+            "rate", str(target_sample_rate),
+            "gain", "-n", "-0.45",
+        ]
+        result = subprocess.run(cmd, input=stdin_data, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"sox: {result.stderr.decode(errors='replace').strip()}")
+    
+    def convert_with_soundfile(self, input_path: Union[str, BinaryIO], output_path: str,
+                               target_sample_rate: int):
+        """
+        Конвертирует файл средствами soundfile + scipy (если sox не установлен)
+        
+        Args:
+            input_path: Путь к исходному файлу или файловый объект с его содержимым
+            output_path: Путь для сохранения конвертированного файла
+            target_sample_rate: Целевая частота дискретизации
+        """
+        with sf.SoundFile(input_path) as source:
+            if source.samplerate != target_sample_rate and soxr is None:
+                # Без soxr нет потокового ресэмплера - обрабатываем файл целиком
+                self.convert_in_memory(source, output_path, target_sample_rate)
+            else:
+                self.convert_streaming(source, output_path, target_sample_rate)
+    
+    def convert_streaming(self, source: "sf.SoundFile", output_path: str, target_sample_rate: int):
+        """
+        Конвертирует файл блоками по BLOCK_SIZE кадров, не загружая его в память целиком
+        
+        Первый проход находит пик моно-сигнала, второй - ресэмплирует (soxr),
+        масштабирует и записывает блоки в выходной файл. Если нужен ресэмплинг,
+        пик берется с выхода ресэмплера (ресэмплинг детерминирован, поэтому
+        второй проход даст тот же сигнал): фильтр может превысить исходный пик,
+        и нормализация по входу приводила бы к обрезанию.
+        
+        Args:
+            source: Открытый исходный файл
+            output_path: Путь для сохранения конвертированного файла
+            target_sample_rate: Целевая частота дискретизации
+        """
+        def make_resampler():
+            if source.samplerate == target_sample_rate:
+                return None
+            return soxr.ResampleStream(source.samplerate, target_sample_rate, 1,
+                                       dtype='float32', quality='HQ')
+        
+        # Первый проход: ищем пик для нормализации
+        peak = 0.0
+        resampler = make_resampler()
+        for block in source.blocks(blocksize=BLOCK_SIZE, dtype='float32', always_2d=True):
+            if resampler is None:
+                peak = max(peak, _mono_peak(block))
+                continue
+            resampled = resampler.resample_chunk(block.mean(axis=1))
+            if len(resampled):
+                peak = max(peak, float(np.abs(resampled).max()))
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            if len(tail):
+                peak = max(peak, float(np.abs(tail).max()))
+        source.seek(0)
+        
+        # Нормализуем данные для 16-bit, оставляя небольшой запас
+        scale = 0.95 * 32767 / peak if peak > 0 else 0.0
+        
+        resampler = make_resampler()
+        
+        # Второй проход: моно -> ресэмплинг -> 16-bit -> запись
+        with sf.SoundFile(output_path, 'w', target_sample_rate, 1, 'PCM_16') as output:
+            for block in source.blocks(blocksize=BLOCK_SIZE, dtype='float32', always_2d=True):
+                mono = block.mean(axis=1)
+                if resampler is not None:
+                    mono = resampler.resample_chunk(mono)
+                output.write(_to_int16(mono, scale))
+            
+            if resampler is not None:
+                # Забираем хвост, оставшийся в буфере ресэмплера
+                tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+                output.write(_to_int16(tail, scale))
+    
+    def convert_in_memory(self, source: "sf.SoundFile", output_path: str, target_sample_rate: int):
+        """
+        Конвертирует файл целиком в памяти с ресэмплингом через samplerate или scipy
+        
+        Args:
+            source: Открытый исходный файл
+            output_path: Путь для сохранения конвертированного файла
+            target_sample_rate: Целевая частота дискретизации
+        """
+        # Загружаем аудиоданные сразу во float32: для 16-bit результата
+        # точности хватает, а объем данных вдвое меньше, чем у float64
+        data = source.read(dtype='float32')
+        current_sample_rate = source.samplerate
+        
+        # Приводим к моно до ресэмплинга, чтобы ресэмплер обрабатывал один канал
+        if data.ndim > 1:
+            data = data.mean(axis=1, dtype=np.float32)
+        
+        if samplerate is not None:
+            # libsamplerate: один вызов C-ресэмплера на весь файл
+            resampler = _src_resampler()
+            resampler.reset()
+            data = resampler.process(data, target_sample_rate / current_sample_rate,
+                                     end_of_input=True)
+        else:
+            # Полифазный ресэмплинг: для 44.1 <-> 48 kHz это отношение 147/160
+            # (фильтр берется из кэша _poly_fir)
+            g = math.gcd(current_sample_rate, target_sample_rate)
+            up, down = target_sample_rate // g, current_sample_rate // g
+            data = signal.resample_poly(data, up, down, window=_poly_fir(up, down))
+        
+        # Нормализуем данные для 16-bit, оставляя небольшой запас
+        peak = _mono_peak(data[:, np.newaxis])
+        scale = 0.95 * 32767 / peak if peak > 0 else 0.0
+        
+        # Конвертируем в 16-bit
+        data_16bit = _to_int16(data, scale)
+        
+        # Сохраняем как WAV файл
+        sf.write(output_path, data_16bit, target_sample_rate, subtype='PCM_16')
+    
+    def process_directory(self, remote_path: str, local_base_path: str, sd_card_path: str,
+                          executor: ProcessPoolExecutor, slots: threading.BoundedSemaphore):
+        """
+        Обходит директорию рекурсивно и скачивает WAV файлы
+        
+        Файлы до IN_MEMORY_DOWNLOAD_LIMIT скачиваются в память, более крупные -
+        во временную папку. Каждый скачанный файл сразу отправляется в пул на
+        конвертацию (см. submit_conversion), поэтому скачивание следующего
+        файла идет параллельно с конвертацией предыдущих.
         
         Args:
             remote_path: Путь на SMB сервере
             local_base_path: Базовый локальный путь для временных файлов
             sd_card_path: Путь к SD карте SP-404 MKII
+            executor: Пул процессов для конвертации
+            slots: Семафор, ограничивающий число файлов в пуле
         """
         logger.info(f"Обрабатываем директорию: {remote_path}")
         
         # Получаем список файлов и папок
         items = self.get_smb_file_list(remote_path)
         
-        for name, is_file in items:
-            normalized_name = self.normalize_name(name)
-            
+        # Выданные в папке имена: файлы конвертируются параллельно, поэтому
+        # два исходных файла не должны получить один и тот же выходной путь
+        used_names = {}
+        
+        for name, is_file, size in items:
             if is_file:
                 # Обрабатываем файл
                 if name.lower().endswith('.wav'):
                     logger.info(f"Обрабатываем WAV файл: {name}")
+                    normalized_name = self.unique_name(self.normalize_name(name), used_names)
+                    output_file = sd_card_path / normalized_name
                     
-                    # Создаем временный файл
-                    temp_file = local_base_path / "temp" / name
-                    temp_file.parent.mkdir(parents=True, exist_ok=True)
+                    # Небольшие файлы держим в памяти: без записи и чтения временного файла
+                    if size <= IN_MEMORY_DOWNLOAD_LIMIT:
+                        data = self.read_smb_file(f"{remote_path}/{name}")
+                        if data is not None:
+                            self.submit_conversion(executor, slots, (name, data, str(output_file)))
+                        else:
+                            logger.error(f"Ошибка скачивания: {name}")
+                        continue
+                    
+                    # Создаем временный файл с уникальным именем: одинаковые
+                    # имена из разных папок не должны перезаписывать друг друга
+                    temp_dir = local_base_path / "temp"
+                    temp_dir.mkdir(parents=True, exist_ok=True)
+                    fd, temp_file = tempfile.mkstemp(suffix='.wav', dir=temp_dir)
+                    os.close(fd)
                     
                     # Скачиваем файл
-                    if self.download_smb_file(f"{remote_path}/{name}", str(temp_file)):
-                        # Создаем выходной файл
-                        output_file = sd_card_path / normalized_name
-                        
-                        # Конвертируем файл
-                        if self.convert_audio_file(str(temp_file), str(output_file)):
-                            logger.info(f"Успешно обработан: {name} -> {normalized_name}")
-                        else:
-                            logger.error(f"Ошибка конвертации: {name}")
-                        
-                        # Удаляем временный файл
-                        temp_file.unlink(missing_ok=True)
+                    if self.download_smb_file(f"{remote_path}/{name}", temp_file):
+                        self.submit_conversion(executor, slots, (name, temp_file, str(output_file)))
                     else:
                         logger.error(f"Ошибка скачивания: {name}")
+                        Path(temp_file).unlink(missing_ok=True)
                 else:
                     logger.info(f"Пропускаем не-WAV файл: {name}")
             else:
@@ -283,6 +636,7 @@ class RolandSP404Automation:
                 logger.info(f"Обрабатываем папку: {name}")
                 
                 # Создаем нормализованную папку
+                normalized_name = self.unique_name(self.normalize_name(name), used_names)
                 normalized_folder = sd_card_path / normalized_name
                 normalized_folder.mkdir(parents=True, exist_ok=True)
                 
@@ -290,9 +644,58 @@ class RolandSP404Automation:
                 self.process_directory(
                     f"{remote_path}/{name}",
                     local_base_path,
-                    normalized_folder
+                    normalized_folder,
+                    executor,
+                    slots
                 )
     
+    def submit_conversion(self, executor: ProcessPoolExecutor, slots: threading.BoundedSemaphore,
+                          work_item: Tuple[str, Union[str, bytes], str]):
+        """
+        Отправляет скачанный файл на конвертацию в пул процессов
+        
+        Блокируется, пока в пуле занято slots файлов: так временные файлы
+        и данные в памяти не накапливаются, если сеть быстрее CPU.
+        
+        Args:
+            executor: Пул процессов для конвертации
+            slots: Семафор, ограничивающий число файлов в пуле
+            work_item: Кортеж (имя, содержимое_или_временный_файл, выходной_файл)
+        """
+        slots.acquire()
+        try:
+            future = executor.submit(_convert_worker, work_item)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(
+            functools.partial(self.finish_conversion, slots, work_item)
+        )
+    
+    def finish_conversion(self, slots: threading.BoundedSemaphore,
+                          work_item: Tuple[str, Union[str, bytes], str], future: Future):
+        """
+        Логирует результат конвертации и освобождает место в пуле
+        
+        Args:
+            slots: Семафор, ограничивающий число файлов в пуле
+            work_item: Кортеж (имя, содержимое_или_временный_файл, выходной_файл)
+            future: Завершенная задача конвертации
+        """
+        name, source, output_file = work_item
+        try:
+            if future.result():
+                logger.info(f"Успешно обработан: {name} -> {Path(output_file).name}")
+            else:
+                logger.error(f"Ошибка конвертации: {name}")
+        except Exception as e:
+            logger.error(f"Ошибка конвертации файла {name}: {e}")
+        finally:
+            # Удаляем временный файл
+            if isinstance(source, str):
+                Path(source).unlink(missing_ok=True)
+            slots.release()
+    
     def run_automation(self, source_path: str, sd_card_path: str):
         """
         Запускает полную автоматизацию
@@ -316,8 +719,23 @@ class RolandSP404Automation:
             local_temp_path = Path("temp_roland_processing")
             local_temp_path.mkdir(parents=True, exist_ok=True)
             
-            # Обрабатываем исходную папку
-            self.process_directory(source_path, local_temp_path, sd_path)
+            # Скачивание идет в основном потоке (единственное SMB соединение),
+            # конвертация - параллельно в пуле процессов. Семафор не дает
+            # временным файлам накапливаться, если сеть быстрее CPU
+            workers = os.cpu_count() or 1
+            slots = threading.BoundedSemaphore(workers * 2)
+            
+            # spawn вместо fork: процесс, форкнутый из многопоточной программы,
+            # может унаследовать захваченную блокировку logging и зависнуть
+            spawn_context = multiprocessing.get_context("spawn")
+            
+            # Конвертер создается один раз на процесс-воркер (initializer),
+            # а не на каждый файл
+            with ProcessPoolExecutor(max_workers=workers, mp_context=spawn_context,
+                                     initializer=_init_worker) as executor:
+                # Обрабатываем исходную папку; выход из with дожидается
+                # завершения всех отправленных конвертаций
+                self.process_directory(source_path, local_temp_path, sd_path, executor, slots)
             
             logger.info("Автоматизация завершена успешно!")
             return True
@@ -336,6 +754,33 @@ class RolandSP404Automation:
                 logger.info("Временные файлы очищены")
 
 
+# Конвертер процесса-воркера, создается в _init_worker
+_worker_automation: Optional["RolandSP404Automation"] = None
+
+
+def _init_worker():
+    """Создает конвертер один раз при запуске процесса-воркера"""
+    global _worker_automation
+    _worker_automation = RolandSP404Automation("", "")
+
+
+def _convert_worker(work_item: Tuple[str, Union[str, bytes], str]) -> bool:
+    """
+    Конвертирует один файл в процессе-воркере ProcessPoolExecutor
+    
+    Args:
+        work_item: Кортеж (имя, содержимое_или_временный_файл, выходной_файл)
+        
+    Returns:
+        True если конвертация успешна, False иначе
+    """
+    name, source, output_file = work_item
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+        source.name = name
+    return _worker_automation.convert_audio_file(source, output_file)
+
+
 def main():
     """Основная функция"""
     print("Roland SP-404 MKII File Automation")
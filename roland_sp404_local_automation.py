@@ -19,10 +19,16 @@ Roland SP-404 MKII Local File Automation Script
 
 import os
 import re
+import math
+import functools
 import shutil
 import logging
+import subprocess
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, Tuple, Optional
 import unicodedata
 
 try:
@@ -33,6 +39,249 @@ except ImportError:
     print("Ошибка: Не установлены soundfile и scipy. Установите: pip install soundfile scipy")
     exit(1)
 
+# Опционально: numba компилирует квантование в 16-bit в один проход по данным
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _quantize_i16(x, scale, out):
+        """Масштабирует сигнал x и записывает его в out как int16 (оба массива одномерные)"""
+        for i in range(x.size):
+            value = x[i] * scale
+            if value > 32767.0:
+                value = 32767.0
+            elif value < -32768.0:
+                value = -32768.0
+            out[i] = np.int16(value)
+else:
+    def _quantize_i16(x, scale, out):
+        """Масштабирует сигнал x и записывает его в out как int16 (оба массива одномерные)"""
+        # Масштабирование и ограничение диапазона выполняются на месте в x
+        # (после ресэмплинга сигнал может немного превышать исходный пик)
+        np.multiply(x, scale, out=x)
+        np.clip(x, -32768, 32767, out=x)
+        np.copyto(out, x, casting='unsafe')
+
+# Размер блока (в кадрах) для потоковой конвертации
+BLOCK_SIZE = 65536
+
+# Размер буфера (в байтах) для записи выходных файлов
+WRITE_BUFFER_SIZE = 1 << 20
+
+# WAV файлы PCM_16 с аудиоданными от этого размера читаются через np.memmap
+MEMMAP_THRESHOLD = 64 * 1024 * 1024
+
+# Пиковый уровень (дБ) нормализации через ffmpeg: 0.95 от полной шкалы
+PEAK_DB = 20 * math.log10(0.95)
+
+# Пиковый уровень из вывода фильтра volumedetect ffmpeg
+_RE_MAX_VOLUME = re.compile(r'max_volume:\s*(-inf|-?\d+(?:\.\d+)?) dB')
+
+@functools.lru_cache(maxsize=None)
+def _poly_fir(up: int, down: int) -> "np.ndarray":
+    """
+    Возвращает ФНЧ для полифазного ресэмплинга с заданными коэффициентами
+    
+    Фильтр совпадает с тем, что строит signal.resample_poly (Kaiser, beta=5.0),
+    но проектируется один раз на пару (up, down).
+    
+    Args:
+        up: Коэффициент интерполяции
+        down: Коэффициент децимации
+        
+    Returns:
+        Коэффициенты FIR фильтра (float32)
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    fir = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    return fir.astype(np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Потоковый полифазный ресэмплер
+    
+    Дает тот же результат, что signal.resample_poly для всего сигнала, но
+    принимает его блоками произвольного размера: каждый блок прогоняется через
+    signal.upfirdn вместе с коротким хвостом предыдущих отсчетов (длина
+    фильтра / up), поэтому в памяти не нужен весь файл.
+    """
+    
+    def __init__(self, up: int, down: int, total_frames: int):
+        """
+        Args:
+            up: Коэффициент интерполяции
+            down: Коэффициент децимации
+            total_frames: Число кадров входного сигнала (из заголовка файла)
+        """
+        self.up = up
+        self.down = down
+        
+        # Фильтр и сдвиг выхода - как в signal.resample_poly
+        half_len = (len(_poly_fir(up, down)) - 1) // 2
+        pre_pad = down - half_len % down
+        self.fir = np.concatenate((np.zeros(pre_pad, dtype=np.float32), _poly_fir(up, down) * up))
+        self.out_start = (half_len + pre_pad) // down
+        total_out = total_frames * up
+        self.out_end = self.out_start + total_out // down + bool(total_out % down)
+        
+        # Сколько входных отсчетов истории нужно для выхода на границе блока
+        # (кратно down, чтобы индексы выхода upfirdn оставались целыми)
+        history = -(-(len(self.fir) - 1) // up)
+        self.history = -(-history // down) * down
+        
+        self.buffer = None
+        self.buffer_start = -self.history
+        self.next_out = 0
+    
+    def _emit(self, segment: "np.ndarray", end: Optional[int]) -> "np.ndarray":
+        """
+        Прогоняет буфер через upfirdn и возвращает готовые отсчеты
+        
+        Args:
+            segment: Входные отсчеты, начиная с self.buffer_start
+            end: Индекс (в выходе upfirdn), до которого выход определен полностью;
+                None - до конца сигнала
+                
+        Returns:
+            Отсчеты выхода из диапазона resample_poly
+        """
+        filtered = signal.upfirdn(self.fir, segment, self.up, self.down, axis=0)
+        offset = self.buffer_start * self.up // self.down
+        if end is None:
+            end = offset + len(filtered)
+        
+        # Выход upfirdn с индексом j соответствует отсчету offset + j всего сигнала
+        start = max(self.next_out, self.out_start)
+        stop = min(end, self.out_end)
+        self.next_out = end
+        if stop <= start:
+            return filtered[:0]
+        return filtered[start - offset:stop - offset]
+    
+    def process(self, block: "np.ndarray") -> "np.ndarray":
+        """
+        Ресэмплирует очередной блок
+        
+        Args:
+            block: Блок входного сигнала (кадры по оси 0)
+            
+        Returns:
+            Ресэмплированные отсчеты, которые уже определены полностью
+        """
+        if self.buffer is None:
+            self.buffer = np.zeros((self.history,) + block.shape[1:], dtype=block.dtype)
+        self.buffer = np.concatenate((self.buffer, block))
+        
+        # Выход определен до границы, кратной down, по всем полученным отсчетам
+        boundary = (self.buffer_start + len(self.buffer)) // self.down * self.down
+        if boundary * self.up // self.down <= self.next_out:
+            return self.buffer[:0]
+        out = self._emit(self.buffer[:boundary - self.buffer_start],
+                         boundary * self.up // self.down)
+        
+        # Оставляем только историю, нужную для следующих блоков
+        keep_from = boundary - self.history
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+        return out
+    
+    def flush(self) -> "np.ndarray":
+        """
+        Возвращает хвост сигнала после последнего блока
+        
+        Returns:
+            Оставшиеся ресэмплированные отсчеты
+        """
+        if self.buffer is None:
+            return np.zeros(0, dtype=np.float32)
+        out = self._emit(self.buffer, None)
+        
+        # resample_poly дополняет фильтр нулями, если выхода не хватает до
+        # нужной длины - эти отсчеты равны нулю
+        missing = self.out_end - max(self.next_out, self.out_start)
+        if missing > 0:
+            out = np.concatenate((out, np.zeros((missing,) + out.shape[1:], dtype=out.dtype)))
+            self.next_out = self.out_end
+        return out
+
+
+def _wav_data_offset(path: str) -> Optional[int]:
+    """
+    Находит смещение аудиоданных (чанк "data") в RIFF/WAVE файле
+    
+    Args:
+        path: Путь к WAV файлу
+        
+    Returns:
+        Смещение первого байта аудиоданных или None, если чанк не найден
+    """
+    with open(path, 'rb') as wav_file:
+        header = wav_file.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+        
+        # Перебираем чанки: 4 байта идентификатора + 4 байта размера (little-endian)
+        while True:
+            chunk_header = wav_file.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id = chunk_header[:4]
+            chunk_size = int.from_bytes(chunk_header[4:], 'little')
+            if chunk_id == b'data':
+                return wav_file.tell()
+            # Чанки выравниваются по четной границе
+            wav_file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+class _BufferPool(threading.local):
+    """
+    Пул рабочих буферов, отдельный для каждого потока
+    
+    Буферы переиспользуются между блоками и файлами, поэтому при конвертации
+    память под блоки не выделяется и не освобождается заново. Хранение в
+    threading.local позволяет обходиться без блокировок.
+    """
+    
+    def __init__(self):
+        self.buffers = {}
+    
+    def get(self, name: str, shape: Tuple[int, ...], dtype) -> "np.ndarray":
+        """
+        Возвращает буфер нужной формы (содержимое не инициализировано)
+        
+        Args:
+            name: Назначение буфера; буферы с разными именами не пересекаются
+            shape: Форма буфера
+            dtype: Тип элементов
+            
+        Returns:
+            Массив-представление поверх буфера пула
+        """
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self.buffers[name] = buffer
+        return buffer[:size].reshape(shape)
+
+
+_buffer_pool = _BufferPool()
+
+
+# Регулярные выражения для normalize_name компилируются один раз
+_INVALID_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+_MULTI_UNDERSCORE = re.compile(r'_+')
+
+# Таблица для ASCII имен: пробел -> '_', остальные символы кроме латиницы,
+# цифр и подчеркиваний удаляются (то же, что NFKD + _INVALID_CHARS для ASCII)
+_FAST_TABLE = str.maketrans({chr(c): ('_' if c == 32 else None) for c in range(128)
+                             if not (chr(c).isalnum() or chr(c) == '_')})
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -53,6 +302,9 @@ class RolandSP404LocalAutomation:
         self.supported_sample_rates = [44100, 48000]
         self.supported_bit_depths = [16, 24]
         
+        # Внешний конвертер ffmpeg (если установлен) работает быстрее scipy
+        self.ffmpeg_path = shutil.which("ffmpeg")
+        
     def normalize_name(self, name: str, counter: int = 0) -> str:
         """
         Нормализует название файла или папки для SP-404 MKII
@@ -64,21 +316,30 @@ class RolandSP404LocalAutomation:
         Returns:
             Нормализованное название (только латиница, цифры, подчеркивания)
         """
-        # Удаляем расширение для обработки
-        name_without_ext = Path(name).stem
-        extension = Path(name).suffix.lower()
+        # Удаляем расширение для обработки. Разбиваем строку напрямую, без
+        # создания объектов Path, но по тем же правилам, что Path.stem/suffix
+        dot = name.rfind('.')
+        if 0 < dot < len(name) - 1:
+            name_without_ext, extension = name[:dot], name[dot:].lower()
+        else:
+            name_without_ext, extension = name, ''
         
-        # Нормализуем Unicode символы
-        normalized = unicodedata.normalize('NFKD', name_without_ext)
-        
-        # Заменяем пробелы на подчеркивания
-        normalized = normalized.replace(' ', '_')
-        
-        # Удаляем все символы кроме латиницы, цифр и подчеркиваний
-        normalized = re.sub(r'[^a-zA-Z0-9_]', '', normalized)
+        if name_without_ext.isascii():
+            # Быстрый путь: для ASCII имен NFKD ничего не меняет, поэтому
+            # замена пробелов и удаление символов делаются одним translate
+            normalized = name_without_ext.translate(_FAST_TABLE)
+        else:
+            # Нормализуем Unicode символы
+            normalized = unicodedata.normalize('NFKD', name_without_ext)
+            
+            # Заменяем пробелы на подчеркивания
+            normalized = normalized.replace(' ', '_')
+            
+            # Удаляем все символы кроме латиницы, цифр и подчеркиваний
+            normalized = _INVALID_CHARS.sub('', normalized)
         
         # Удаляем множественные подчеркивания
-        normalized = re.sub(r'_+', '_', normalized)
+        normalized = _MULTI_UNDERSCORE.sub('_', normalized)
         
         # Удаляем подчеркивания в начале и конце
         normalized = normalized.strip('_')
@@ -92,6 +353,39 @@ class RolandSP404LocalAutomation:
             
         return normalized + extension
     
+    def unique_name(self, name: str, used_names: Dict[str, int]) -> str:
+        """
+        Возвращает имя, не совпадающее с уже выданными в той же папке
+        
+        Имена сравниваются без учета регистра: файловые системы SD карт
+        (FAT32/exFAT) его не различают. При совпадении к имени добавляется
+        номер (_001, _002, ...), поэтому результат зависит только от порядка
+        элементов, а не от успеха конвертации.
+        
+        Args:
+            name: Нормализованное имя
+            used_names: Выданные имена в нижнем регистре -> последний номер,
+                        добавленный к этому имени (дополняется на месте)
+            
+        Returns:
+            Уникальное в пределах папки имя
+        """
+        key = name.lower()
+        if key not in used_names:
+            used_names[key] = 0
+            return name
+        
+        stem, extension = os.path.splitext(name)
+        counter = used_names[key]
+        while True:
+            counter += 1
+            candidate = f"{stem}_{counter:03d}{extension}"
+            if candidate.lower() not in used_names:
+                break
+        used_names[key] = counter
+        used_names[candidate.lower()] = 0
+        return candidate
+    
     def convert_audio_file(self, input_path: str, output_path: str) -> bool:
         """
         Конвертирует аудиофайл в формат, поддерживаемый SP-404 MKII
@@ -104,42 +398,39 @@ class RolandSP404LocalAutomation:
             True если конвертация успешна, False иначе
         """
         try:
-            # Загружаем аудиофайл
-            data, sample_rate = sf.read(input_path)
+            # Файл уже в формате SP-404 MKII - копируем без перекодирования.
+            # sf.info читает только заголовок, а shutil.copyfile копирует данные
+            # средствами ядра (sendfile в Linux, fcopyfile в macOS)
+            info = sf.info(input_path)
+            if (info.format == 'WAV' and info.subtype == 'PCM_16'
+                    and info.samplerate in self.supported_sample_rates):
+                shutil.copyfile(input_path, output_path)
+                logger.info(f"Файл уже в нужном формате, скопирован: {output_path}")
+                return True
             
-            # Проверяем текущие параметры
-            current_channels = 1 if data.ndim == 1 else data.shape[1]
-            current_sample_rate = sample_rate
-            
-            logger.info(f"Исходный файл: {current_sample_rate}Hz, {current_channels}ch")
-            
-            # Выбираем ближайшую поддерживаемую частоту дискретизации
-            target_sample_rate = min(self.supported_sample_rates, 
-                                   key=lambda x: abs(x - current_sample_rate))
+            with sf.SoundFile(input_path) as source:
+                # Проверяем текущие параметры
+                current_channels = source.channels
+                current_sample_rate = source.samplerate
+                
+                logger.info(f"Исходный файл: {current_sample_rate}Hz, {current_channels}ch")
+                
+                # Выбираем ближайшую поддерживаемую частоту дискретизации
+                target_sample_rate = min(self.supported_sample_rates, 
+                                       key=lambda x: abs(x - current_sample_rate))
+                
+                # Сохраняем стерео, если исходный файл стерео (SP-404 MKII поддерживает стерео)
+                if current_channels > 1:
+                    logger.info(f"Сохраняем стерео ({current_channels} каналов)")
+                
+                if self.ffmpeg_path:
+                    self.convert_with_ffmpeg(input_path, output_path, target_sample_rate)
+                else:
+                    # Конвертируем файл блоками, не загружая его целиком
+                    self.convert_streaming(source, output_path, target_sample_rate)
             
-            # Конвертируем частоту дискретизации если нужно
             if current_sample_rate != target_sample_rate:
-                # Используем scipy для ресэмплинга
-                num_samples = int(len(data) * target_sample_rate / current_sample_rate)
-                if data.ndim == 1:
-                    data = signal.resample(data, num_samples)
-                else:
-                    data = signal.resample(data, num_samples, axis=0)
                 logger.info(f"Изменена частота дискретизации: {current_sample_rate} -> {target_sample_rate}")
-            
-            # Сохраняем стерео, если исходный файл стерео (SP-404 MKII поддерживает стерео)
-            if current_channels > 1:
-                logger.info(f"Сохраняем стерео ({current_channels} каналов)")
-            
-            # Нормализуем данные для 16-bit
-            if np.max(np.abs(data)) > 0:
-                data = data / np.max(np.abs(data)) * 0.95  # Оставляем небольшой запас
-            
-            # Конвертируем в 16-bit
-            data_16bit = (data * 32767).astype(np.int16)
-            
-            # Сохраняем как WAV файл
-            sf.write(output_path, data_16bit, target_sample_rate, subtype='PCM_16')
             logger.info(f"Файл конвертирован: {output_path}")
             return True
             
@@ -147,60 +438,254 @@ class RolandSP404LocalAutomation:
             logger.error(f"Ошибка конвертации файла {input_path}: {e}")
             return False
     
-    def process_directory(self, source_path: Path, target_path: Path):
+    def convert_with_ffmpeg(self, input_path: str, output_path: str, target_sample_rate: int):
         """
-        Обрабатывает директорию рекурсивно
+        Конвертирует файл через ffmpeg (если ffmpeg установлен)
+        
+        Первый запуск (фильтр volumedetect) измеряет пиковый уровень, второй -
+        ресэмплирует, нормализует пик до 0.95 и записывает 16-bit PCM.
         
         Args:
-            source_path: Путь к исходной папке
-            target_path: Путь к целевой папке на SD карте
+            input_path: Путь к исходному файлу
+            output_path: Путь для сохранения конвертированного файла
+            target_sample_rate: Целевая частота дискретизации
         """
-        logger.info(f"Обрабатываем директорию: {source_path}")
+        # Первый проход: пиковый уровень сигнала
+        cmd = [
+            self.ffmpeg_path, "-hide_banner", "-nostats",
+            "-i", input_path,
+            "-af", "volumedetect", "-f", "null", "-",
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg: {result.stderr.decode(errors='replace').strip()}")
         
-        # Создаем целевую папку если не существует
-        target_path.mkdir(parents=True, exist_ok=True)
+        # Усиление до пика 0.95 (для тишины уровень не меняем)
+        match = _RE_MAX_VOLUME.search(result.stderr.decode(errors='replace'))
+        gain_db = 0.0
+        if match and match.group(1) != '-inf':
+            gain_db = PEAK_DB - float(match.group(1))
         
-        try:
-            # Получаем список элементов в папке
-            items = list(source_path.iterdir())
+        # Второй проход: ресэмплинг, нормализация и запись в 16-bit
+        cmd = [
+            self.ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error",
+            "-i", input_path,
+            "-af", f"volume={gain_db:.4f}dB",
+            "-ar", str(target_sample_rate),
+            "-c:a", "pcm_s16le", output_path,
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg: {result.stderr.decode(errors='replace').strip()}")
+    
+    def convert_streaming(self, source: "sf.SoundFile", output_path: str, target_sample_rate: int):
+        """
+        Конвертирует файл блоками
+        
+        Первый проход находит пиковую амплитуду уже ресэмплированного сигнала
+        (у ресэмплированного пик может быть выше исходного), второй -
+        ресэмплирует блоки (PolyphaseResampler), масштабирует и записывает их
+        в 16-bit, поэтому в памяти находится только один блок.
+        
+        Args:
+            source: Открытый исходный файл
+            output_path: Путь для сохранения конвертированного файла
+            target_sample_rate: Целевая частота дискретизации
+        """
+        # Блоки читаются в буфер из пула, без выделения памяти на каждый блок
+        block_shape = (BLOCK_SIZE,) if source.channels == 1 else (BLOCK_SIZE, source.channels)
+        read_buffer = _buffer_pool.get('read', block_shape, np.float32)
+        
+        # Полифазный ресэмплинг: для 44.1 <-> 48 kHz это отношение 147/160.
+        # Длина выхода считается по числу кадров из заголовка файла.
+        # Ресэмплер хранит состояние, поэтому на каждый проход нужен новый
+        def make_resampler():
+            if source.samplerate == target_sample_rate:
+                return None
+            g = math.gcd(target_sample_rate, source.samplerate)
+            return PolyphaseResampler(target_sample_rate // g, source.samplerate // g,
+                                      source.frames)
+        
+        # Первый проход: пиковая амплитуда для нормализации. Пик берется
+        # после ресэмплинга, иначе выбросы фильтра могут дать клиппинг
+        peak = 0.0
+        resampler = make_resampler()
+        for block in self.iter_blocks(source, read_buffer):
+            if resampler is not None:
+                block = resampler.process(block)
+            if len(block):
+                peak = max(peak, float(-block.min()), float(block.max()))
+        if resampler is not None:
+            tail = resampler.flush()
+            if len(tail):
+                peak = max(peak, float(-tail.min()), float(tail.max()))
+        
+        # Нормализуем данные для 16-bit, оставляя небольшой запас
+        scale = 0.95 * 32767 / peak if peak > 0 else 32767.0
+        
+        # Второй проход: ресэмплинг, масштабирование и запись в 16-bit.
+        # libsndfile пишет мелкими порциями - пропускаем запись через буфер
+        # WRITE_BUFFER_SIZE, чтобы на SD карту уходили крупные блоки
+        source.seek(0)
+        resampler = make_resampler()
+        with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as output_file, \
+                sf.SoundFile(output_file, 'w', samplerate=target_sample_rate,
+                             channels=source.channels, format='WAV',
+                             subtype='PCM_16') as output:
+            for block in self.iter_blocks(source, read_buffer):
+                if resampler is not None:
+                    block = resampler.process(block)
+                self.write_int16(output, block, scale)
             
-            # Счетчик для уникальности имен файлов
-            file_counter = 0
+            if resampler is not None:
+                # Забираем хвост, оставшийся в буфере ресэмплера
+                self.write_int16(output, resampler.flush(), scale)
+    
+    def iter_blocks(self, source: "sf.SoundFile", read_buffer: "np.ndarray"):
+        """
+        Читает файл блоками float32 в read_buffer
+        
+        Большие WAV файлы PCM_16 читаются через np.memmap: данные берутся
+        прямо из страничного кэша ОС, без копирования всего файла через
+        libsndfile. Остальные файлы читаются средствами soundfile.
+        
+        Args:
+            source: Открытый исходный файл (позиция чтения - начало)
+            read_buffer: Буфер на BLOCK_SIZE кадров
             
-            for item in items:
-                if item.is_file():
-                    # Обрабатываем файл
-                    if item.suffix.lower() == '.wav':
+        Yields:
+            Блоки сигнала (представления read_buffer)
+        """
+        data_offset = None
+        pcm_size = source.frames * source.channels * 2
+        if (source.format in ('WAV', 'WAVEX') and source.subtype == 'PCM_16'
+                and pcm_size >= MEMMAP_THRESHOLD):
+            data_offset = _wav_data_offset(source.name)
+            if data_offset is not None and data_offset + pcm_size > os.path.getsize(source.name):
+                data_offset = None
+        
+        if data_offset is None:
+            yield from source.blocks(dtype='float32', out=read_buffer)
+            return
+        
+        shape = (source.frames,) if source.channels == 1 else (source.frames, source.channels)
+        raw = np.memmap(source.name, dtype='<i2', mode='r', offset=data_offset, shape=shape)
+        try:
+            for start in range(0, source.frames, BLOCK_SIZE):
+                chunk = raw[start:start + BLOCK_SIZE]
+                block = read_buffer[:len(chunk)]
+                # Та же шкала, что у libsndfile: int16 / 32768
+                np.multiply(chunk, np.float32(1.0 / 32768.0), out=block)
+                yield block
+        finally:
+            del raw
+    
+    def write_int16(self, output: "sf.SoundFile", block: "np.ndarray", scale: float):
+        """
+        Масштабирует блок и дописывает его в файл как 16-bit
+        
+        Args:
+            output: Открытый на запись выходной файл
+            block: Блок сигнала (float32, может быть изменен на месте)
+            scale: Множитель нормализации
+        """
+        if not len(block):
+            return
+        block_16bit = _buffer_pool.get('int16', block.shape, np.int16)
+        _quantize_i16(block.reshape(-1), scale, block_16bit.reshape(-1))
+        output.write(block_16bit)
+    
+    def process_directory(self, source_path: Path, target_path: Path):
+        """
+        Обрабатывает директорию вместе со всеми вложенными папками
+        
+        Папки обходятся через явный стек, а WAV файлы со всего дерева
+        отправляются в общий пул процессов: файлы из разных папок конвертируются
+        параллельно, и глубина вложенности не ограничена лимитом рекурсии.
+        
+        Args:
+            source_path: Путь к исходной папке
+            target_path: Путь к целевой папке на SD карте
+        """
+        futures = {}
+        
+        # Конвертируем WAV файлы в отдельных процессах: нормализация и
+        # квантование без numba выполняются под GIL и в потоках не масштабируются.
+        # spawn вместо fork: форк многопоточной программы может унаследовать
+        # захваченную блокировку logging и зависнуть
+        spawn_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=spawn_context) as executor:
+            stack = [(source_path, target_path)]
+            while stack:
+                source_dir, target_dir = stack.pop()
+                logger.info(f"Обрабатываем директорию: {source_dir}")
+                
+                # Создаем целевую папку если не существует
+                target_dir.mkdir(parents=True, exist_ok=True)
+                
+                try:
+                    # Получаем список элементов в папке. os.scandir отдает тип элемента
+                    # вместе с содержимым папки, без отдельного stat на каждый файл
+                    with os.scandir(source_dir) as entries:
+                        items = list(entries)
+                    
+                    wav_items = []
+                    subdirs = []
+                    for item in items:
+                        if item.is_file():
+                            # Как и Path.suffix, имя ".wav" без основы расширением не считается
+                            if len(item.name) > 4 and item.name[-4:].lower() == '.wav':
+                                wav_items.append(item)
+                            else:
+                                logger.info(f"Пропускаем не-WAV файл: {item.name}")
+                        elif item.is_dir():
+                            subdirs.append(item)
+                    
+                    # Имена в папке выдаются заранее и без повторов: файлы и
+                    # подпапки делят одно пространство имен
+                    used_names = {}
+                    
+                    for item in wav_items:
                         logger.info(f"Обрабатываем WAV файл: {item.name}")
                         
-                        # Создаем нормализованное имя файла с уникальным номером
-                        normalized_name = self.normalize_name(item.name, file_counter)
-                        output_file = target_path / normalized_name
-                        
-                        # Конвертируем файл
-                        if self.convert_audio_file(str(item), str(output_file)):
-                            logger.info(f"Успешно обработан: {item.name} -> {normalized_name}")
-                            file_counter += 1
-                        else:
-                            logger.error(f"Ошибка конвертации: {item.name}")
-                    else:
-                        logger.info(f"Пропускаем не-WAV файл: {item.name}")
+                        # Создаем нормализованное имя файла, уникальное в папке
+                        normalized_name = self.unique_name(self.normalize_name(item.name), used_names)
+                        output_file = target_dir / normalized_name
                         
-                elif item.is_dir():
-                    # Обрабатываем папку
-                    logger.info(f"Обрабатываем папку: {item.name}")
+                        future = executor.submit(_convert_worker, item.path, str(output_file))
+                        futures[future] = (item, normalized_name)
                     
-                    # Создаем нормализованную папку
-                    normalized_folder_name = self.normalize_name(item.name)
-                    normalized_folder = target_path / normalized_folder_name
+                    folders = []
+                    for item in subdirs:
+                        # Обрабатываем папку
+                        logger.info(f"Обрабатываем папку: {item.name}")
+                        
+                        # Создаем нормализованную папку
+                        normalized_folder_name = self.unique_name(self.normalize_name(item.name),
+                                                                  used_names)
+                        folders.append((Path(item.path), target_dir / normalized_folder_name))
                     
-                    # Рекурсивно обрабатываем содержимое папки
-                    self.process_directory(item, normalized_folder)
+                    # Кладем папки в стек в обратном порядке, чтобы обходить их по порядку
+                    stack.extend(reversed(folders))
                     
-        except PermissionError as e:
-            logger.error(f"Ошибка доступа к папке {source_path}: {e}")
-        except Exception as e:
-            logger.error(f"Ошибка обработки папки {source_path}: {e}")
+                except PermissionError as e:
+                    logger.error(f"Ошибка доступа к папке {source_dir}: {e}")
+                except Exception as e:
+                    logger.error(f"Ошибка обработки папки {source_dir}: {e}")
+            
+            for future in as_completed(futures):
+                item, normalized_name = futures[future]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    # Например, воркер аварийно завершился (BrokenProcessPool)
+                    logger.error(f"Ошибка конвертации файла {item.path}: {e}")
+                    success = False
+                
+                if success:
+                    logger.info(f"Успешно обработан: {item.name} -> {normalized_name}")
+                else:
+                    logger.error(f"Ошибка конвертации: {item.name}")
     
     def run_automation(self, source_path: str, sd_card_path: str):
         """
@@ -238,6 +723,20 @@ class RolandSP404LocalAutomation:
             return False
 
 
+def _convert_worker(input_path: str, output_path: str) -> bool:
+    """
+    Конвертирует один файл в процессе-воркере ProcessPoolExecutor
+    
+    Args:
+        input_path: Путь к исходному файлу
+        output_path: Путь для сохранения конвертированного файла
+        
+    Returns:
+        True если конвертация успешна, False иначе
+    """
+    return RolandSP404LocalAutomation().convert_audio_file(input_path, output_path)
+
+
 def main():
     """Основная функция"""
     print("Roland SP-404 MKII Local File Automation")
@@ -17,13 +17,23 @@ Roland SP-404 MKII macOS File Automation Script
 - soundfile, scipy, numpy (для конвертации аудио)
 """
 
+import io
 import os
 import re
+import sys
+import math
+import functools
+import contextlib
 import shutil
 import logging
+import tempfile
 import subprocess
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Optional
+from urllib.parse import quote
+from typing import BinaryIO, List, Set, Tuple, Optional
 import unicodedata
 
 try:
@@ -34,6 +44,195 @@ except ImportError:
     print("Ошибка: Не установлены soundfile и scipy. Установите: pip install soundfile scipy")
     exit(1)
 
+# fcntl есть только в POSIX системах (нужен для F_NOCACHE в macOS)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Опционально: numba компилирует квантование в 16-bit в один проход по данным
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _quantize_i16(x, scale, out):
+        """Масштабирует сигнал x и записывает его в out как int16 (оба массива одномерные)"""
+        for i in range(x.size):
+            value = x[i] * scale
+            if value > 32767.0:
+                value = 32767.0
+            elif value < -32768.0:
+                value = -32768.0
+            out[i] = np.int16(value)
+else:
+    def _quantize_i16(x, scale, out):
+        """Масштабирует сигнал x и записывает его в out как int16 (оба массива одномерные)"""
+        # Масштабирование и ограничение диапазона выполняются на месте в x
+        # (после ресэмплинга сигнал может немного превышать исходный пик)
+        np.multiply(x, scale, out=x)
+        np.clip(x, -32768, 32767, out=x)
+        np.copyto(out, x, casting='unsafe')
+
+# Поддерживаемые форматы для SP-404 MKII
+SUPPORTED_SAMPLE_RATES = [44100, 48000]
+SUPPORTED_BIT_DEPTHS = [16, 24]
+
+# Сколько файлов отдается процессу-воркеру за один раз
+CONVERT_CHUNKSIZE = 8
+
+# Сколько файлов воркер читает с SMB шары заранее, пока конвертирует текущий
+PREFETCH_DEPTH = 2
+
+# Файлы до этого размера читаются заранее в память, более крупные
+# конвертируются потоково прямо с шары
+IN_MEMORY_PREFETCH_LIMIT = 10 * 1024 * 1024
+
+# afconvert (CoreAudio) ресэмплирует быстрее scipy; есть только в macOS
+AFCONVERT_PATH = shutil.which("afconvert") if sys.platform == "darwin" else None
+
+# Размер буфера (в байтах) для записи выходных файлов
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Допустимое расхождение (в кадрах) длины результата afconvert с resample_poly
+AFCONVERT_FRAME_TOLERANCE = 2048
+
+# Размер блока (в кадрах) для потоковой конвертации
+BLOCK_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=None)
+def _poly_fir(up: int, down: int) -> "np.ndarray":
+    """
+    Возвращает ФНЧ для полифазного ресэмплинга с заданными коэффициентами
+    
+    Фильтр совпадает с тем, что строит signal.resample_poly (Kaiser, beta=5.0),
+    но проектируется один раз на пару (up, down).
+    
+    Args:
+        up: Коэффициент интерполяции
+        down: Коэффициент децимации
+        
+    Returns:
+        Коэффициенты FIR фильтра (float32)
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    fir = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    return fir.astype(np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Потоковый полифазный ресэмплер
+    
+    Дает тот же результат, что signal.resample_poly для всего сигнала, но
+    принимает его блоками произвольного размера: каждый блок прогоняется через
+    signal.upfirdn вместе с коротким хвостом предыдущих отсчетов (длина
+    фильтра / up), поэтому в памяти не нужен весь файл.
+    """
+    
+    def __init__(self, up: int, down: int, total_frames: int):
+        """
+        Args:
+            up: Коэффициент интерполяции
+            down: Коэффициент децимации
+            total_frames: Число кадров входного сигнала (из заголовка файла)
+        """
+        self.up = up
+        self.down = down
+        
+        # Фильтр и сдвиг выхода - как в signal.resample_poly
+        half_len = (len(_poly_fir(up, down)) - 1) // 2
+        pre_pad = down - half_len % down
+        self.fir = np.concatenate((np.zeros(pre_pad, dtype=np.float32), _poly_fir(up, down) * up))
+        self.out_start = (half_len + pre_pad) // down
+        total_out = total_frames * up
+        self.out_end = self.out_start + total_out // down + bool(total_out % down)
+        
+        # Сколько входных отсчетов истории нужно для выхода на границе блока
+        # (кратно down, чтобы индексы выхода upfirdn оставались целыми)
+        history = -(-(len(self.fir) - 1) // up)
+        self.history = -(-history // down) * down
+        
+        self.buffer = None
+        self.buffer_start = -self.history
+        self.next_out = 0
+    
+    def _emit(self, segment: "np.ndarray", end: Optional[int]) -> "np.ndarray":
+        """
+        Прогоняет буфер через upfirdn и возвращает готовые отсчеты
+        
+        Args:
+            segment: Входные отсчеты, начиная с self.buffer_start
+            end: Индекс (в выходе upfirdn), до которого выход определен полностью;
+                None - до конца сигнала
+                
+        Returns:
+            Отсчеты выхода из диапазона resample_poly
+        """
+        filtered = signal.upfirdn(self.fir, segment, self.up, self.down, axis=0)
+        offset = self.buffer_start * self.up // self.down
+        if end is None:
+            end = offset + len(filtered)
+        
+        # Выход upfirdn с индексом j соответствует отсчету offset + j всего сигнала
+        start = max(self.next_out, self.out_start)
+        stop = min(end, self.out_end)
+        self.next_out = end
+        if stop <= start:
+            return filtered[:0]
+        return filtered[start - offset:stop - offset]
+    
+    def process(self, block: "np.ndarray") -> "np.ndarray":
+        """
+        Ресэмплирует очередной блок
+        
+        Args:
+            block: Блок входного сигнала (кадры по оси 0)
+            
+        Returns:
+            Ресэмплированные отсчеты, которые уже определены полностью
+        """
+        if self.buffer is None:
+            self.buffer = np.zeros((self.history,) + block.shape[1:], dtype=block.dtype)
+        self.buffer = np.concatenate((self.buffer, block))
+        
+        # Выход определен до границы, кратной down, по всем полученным отсчетам
+        boundary = (self.buffer_start + len(self.buffer)) // self.down * self.down
+        if boundary * self.up // self.down <= self.next_out:
+            return self.buffer[:0]
+        out = self._emit(self.buffer[:boundary - self.buffer_start],
+                         boundary * self.up // self.down)
+        
+        # Оставляем только историю, нужную для следующих блоков
+        keep_from = boundary - self.history
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+        return out
+    
+    def flush(self) -> "np.ndarray":
+        """
+        Возвращает хвост сигнала после последнего блока
+        
+        Returns:
+            Оставшиеся ресэмплированные отсчеты
+        """
+        if self.buffer is None:
+            return np.zeros(0, dtype=np.float32)
+        out = self._emit(self.buffer, None)
+        
+        # resample_poly дополняет фильтр нулями, если выхода не хватает до
+        # нужной длины - эти отсчеты равны нулю
+        missing = self.out_end - max(self.next_out, self.out_start)
+        if missing > 0:
+            out = np.concatenate((out, np.zeros((missing,) + out.shape[1:], dtype=out.dtype)))
+            self.next_out = self.out_end
+        return out
+
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -45,14 +244,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _build_fold_table() -> dict:
+    """
+    Строит таблицу str.translate для приведения латиницы к ASCII
+    
+    Для символов Latin-1 Supplement и Latin Extended-A/B (U+0080-U+024F)
+    таблица сразу дает то, что осталось бы после NFKD без диакритических
+    знаков; пробелы заменяются на подчеркивания.
+    
+    Returns:
+        Таблица для str.translate
+    """
+    fold = {ord(' '): '_'}
+    for code in range(0x80, 0x250):
+        decomposed = unicodedata.normalize('NFKD', chr(code))
+        base = ''.join(c for c in decomposed if not unicodedata.combining(c))
+        if base.isascii():
+            fold[code] = base.replace(' ', '_')
+    return str.maketrans(fold)
+
+
 class RolandSP404MacOSAutomation:
+    # Шаблоны для нормализации имен компилируются один раз
+    _RE_NON_ASCII = re.compile(r'[^a-zA-Z0-9_]')
+    _RE_MULTI_US = re.compile(r'_+')
+    
+    # Таблица приведения латиницы к ASCII (и пробелов к подчеркиваниям)
+    _FOLD_TABLE = _build_fold_table()
+    
+    # Быстрый путь для ASCII имен (bytes.translate): пробел -> '_', остальные
+    # символы кроме латиницы, цифр и подчеркиваний удаляются
+    _ASCII_TABLE = bytes.maketrans(b' ', b'_')
+    _ASCII_DELETE = bytes(c for c in range(128)
+                          if not (chr(c).isalnum() or chr(c) in '_ '))
+    
     def __init__(self):
         """
         Инициализация класса для автоматизации Roland SP-404 MKII
         """
         # Поддерживаемые форматы для SP-404 MKII
-        self.supported_sample_rates = [44100, 48000]
-        self.supported_bit_depths = [16, 24]
+        self.supported_sample_rates = SUPPORTED_SAMPLE_RATES
+        self.supported_bit_depths = SUPPORTED_BIT_DEPTHS
+        
+        # Точки монтирования SMB шар, подключенных этим скриптом
+        self.owned_mounts = set()
         
     def normalize_name(self, name: str, counter: int = 0) -> str:
         """
@@ -65,21 +300,32 @@ class RolandSP404MacOSAutomation:
         Returns:
             Нормализованное название (только латиница, цифры, подчеркивания)
         """
-        # Удаляем расширение для обработки
-        name_without_ext = Path(name).stem
-        extension = Path(name).suffix.lower()
+        # Удаляем расширение для обработки. Разбиваем строку напрямую, без
+        # создания объектов Path, но по тем же правилам, что Path.stem/suffix
+        dot = name.rfind('.')
+        if 0 < dot < len(name) - 1:
+            name_without_ext, extension = name[:dot], name[dot:].lower()
+        else:
+            name_without_ext, extension = name, ''
         
-        # Нормализуем Unicode символы
-        normalized = unicodedata.normalize('NFKD', name_without_ext)
-        
-        # Заменяем пробелы на подчеркивания
-        normalized = normalized.replace(' ', '_')
-        
-        # Удаляем все символы кроме латиницы, цифр и подчеркиваний
-        normalized = re.sub(r'[^a-zA-Z0-9_]', '', normalized)
+        if name_without_ext.isascii():
+            # Быстрый путь: для ASCII имен NFKD ничего не меняет, поэтому
+            # замена пробелов и удаление символов делаются одним translate
+            normalized = name_without_ext.encode('ascii').translate(
+                self._ASCII_TABLE, self._ASCII_DELETE).decode('ascii')
+        else:
+            # Приводим латиницу к ASCII и заменяем пробелы на подчеркивания
+            normalized = name_without_ext.translate(self._FOLD_TABLE)
+            
+            # Остальные символы (кириллица, полноширинные и т.п.) - через NFKD
+            if not normalized.isascii():
+                normalized = unicodedata.normalize('NFKD', normalized).translate(self._FOLD_TABLE)
+            
+            # Удаляем все символы кроме латиницы, цифр и подчеркиваний
+            normalized = self._RE_NON_ASCII.sub('', normalized)
         
         # Удаляем множественные подчеркивания
-        normalized = re.sub(r'_+', '_', normalized)
+        normalized = self._RE_MULTI_US.sub('_', normalized)
         
         # Удаляем подчеркивания в начале и конце
         normalized = normalized.strip('_')
@@ -104,53 +350,41 @@ class RolandSP404MacOSAutomation:
         Returns:
             True если конвертация успешна, False иначе
         """
-        try:
-            # Загружаем аудиофайл
-            data, sample_rate = sf.read(input_path)
-            
-            # Проверяем текущие параметры
-            current_channels = 1 if data.ndim == 1 else data.shape[1]
-            current_sample_rate = sample_rate
-            
-            logger.info(f"Исходный файл: {current_sample_rate}Hz, {current_channels}ch")
-            
-            # Выбираем ближайшую поддерживаемую частоту дискретизации
-            target_sample_rate = min(self.supported_sample_rates, 
-                                   key=lambda x: abs(x - current_sample_rate))
-            
-            # Конвертируем частоту дискретизации если нужно
-            if current_sample_rate != target_sample_rate:
-                # Используем scipy для ресэмплинга
-                num_samples = int(len(data) * target_sample_rate / current_sample_rate)
-                if data.ndim == 1:
-                    data = signal.resample(data, num_samples)
-                else:
-                    data = signal.resample(data, num_samples, axis=0)
-                logger.info(f"Изменена частота дискретизации: {current_sample_rate} -> {target_sample_rate}")
-            
-            # Сохраняем стерео, если исходный файл стерео (SP-404 MKII поддерживает стерео)
-            if current_channels > 1:
-                logger.info(f"Сохраняем стерео ({current_channels} каналов)")
-            
-            # Нормализуем данные для 16-bit
-            if np.max(np.abs(data)) > 0:
-                data = data / np.max(np.abs(data)) * 0.95  # Оставляем небольшой запас
-            
-            # Конвертируем в 16-bit
-            data_16bit = (data * 32767).astype(np.int16)
-            
-            # Сохраняем как WAV файл
-            sf.write(output_path, data_16bit, target_sample_rate, subtype='PCM_16')
-            logger.info(f"Файл конвертирован: {output_path}")
-            return True
+        return _convert_one((input_path, output_path))
+    
+    def unique_name(self, name: str, used_names: Set[str]) -> str:
+        """
+        Возвращает имя, не совпадающее с уже выданными в той же папке
+        
+        Имена сравниваются без учета регистра (FAT32/exFAT на SD карте его не
+        различают). Номер (_001, _002, ...) добавляется только при совпадении.
+        
+        Args:
+            name: Нормализованное имя
+            used_names: Выданные в папке имена в нижнем регистре (дополняется на месте)
             
-        except Exception as e:
-            logger.error(f"Ошибка конвертации файла {input_path}: {e}")
-            return False
+        Returns:
+            Уникальное в пределах папки имя
+        """
+        candidate = name
+        stem, dot, extension = name.rpartition('.')
+        if not stem:
+            stem, dot, extension = name, '', ''
+        counter = 0
+        while candidate.lower() in used_names:
+            counter += 1
+            candidate = f"{stem}_{counter:03d}{dot}{extension}"
+        used_names.add(candidate.lower())
+        return candidate
     
     def mount_smb_share(self, server: str, share: str, username: str = "", password: str = "") -> Optional[str]:
         """
-        Подключает SMB шару через встроенные возможности macOS
+        Подключает SMB шару через mount_smbfs
+        
+        mount_smbfs монтирует шару напрямую, без Finder и AppleScript. Точка
+        монтирования создается во временной папке, так как /Volumes доступна
+        на запись только root. Подключенные здесь шары запоминаются в
+        self.owned_mounts: отключать можно только их.
         
         Args:
             server: IP адрес сервера
@@ -161,121 +395,223 @@ class RolandSP404MacOSAutomation:
         Returns:
             Путь к подключенной папке или None при ошибке
         """
+        mount_path = None
         try:
-            # Формируем URL для подключения
+            # Шара уже подключена (например, через Finder) - используем ее,
+            # но не считаем своей
+            volume_path = f"/Volumes/{share}"
+            if os.path.ismount(volume_path):
+                logger.info(f"SMB шара уже подключена: {volume_path}")
+                return volume_path
+            
+            # Формируем URL для подключения (спецсимволы экранируются)
+            location = f"{quote(server, safe='[]:')}/{quote(share, safe='')}"
+            options = []
             if username and password:
-                smb_url = f"smb://{username}:{password}@{server}/{share}"
+                smb_url = f"//{quote(username, safe='')}:{quote(password, safe='')}@{location}"
             elif username:
-                smb_url = f"smb://{username}@{server}/{share}"
+                smb_url = f"//{quote(username, safe='')}@{location}"
             else:
-                smb_url = f"smb://{server}/{share}"
+                smb_url = f"//guest@{location}"
+                # Гостевой вход - пароль не запрашиваем
+                options.append("-N")
             
-            logger.info(f"Подключаемся к SMB шаре: {smb_url}")
+            logger.info(f"Подключаемся к SMB шаре: //{server}/{share}")
             
-            # Используем osascript для подключения через AppleScript
-            script = f'''
-            tell application "Finder"
-                try
-                    mount volume "{smb_url}"
-                    return "success"
-                on error errMsg
-                    return "error: " & errMsg
-                end try
-            end tell
-            '''
-            
-            result = subprocess.run(['osascript', '-e', script], 
+            mount_path = tempfile.mkdtemp(prefix="sp404_smb_")
+            result = subprocess.run(['mount_smbfs', *options, smb_url, mount_path],
                                   capture_output=True, text=True, timeout=30)
             
-            if result.returncode == 0 and "success" in result.stdout:
-                # Ищем подключенную папку в /Volumes
-                mount_path = f"/Volumes/{share}"
-                if Path(mount_path).exists():
-                    logger.info(f"SMB шара успешно подключена: {mount_path}")
-                    return mount_path
-                else:
-                    logger.error(f"Папка не найдена после подключения: {mount_path}")
-                    return None
+            if result.returncode == 0:
+                logger.info(f"SMB шара успешно подключена: {mount_path}")
+                self.owned_mounts.add(mount_path)
+                return mount_path
             else:
-                logger.error(f"Ошибка подключения SMB: {result.stderr}")
+                logger.error(f"Ошибка подключения SMB: {result.stderr.strip()}")
+                self._remove_mount_point(mount_path)
                 return None
                 
         except subprocess.TimeoutExpired:
             logger.error("Таймаут при подключении к SMB шаре")
+            if mount_path:
+                self._remove_mount_point(mount_path)
             return None
         except Exception as e:
             logger.error(f"Ошибка подключения к SMB шаре: {e}")
+            if mount_path:
+                self._remove_mount_point(mount_path)
             return None
     
     def unmount_smb_share(self, mount_path: str):
         """
-        Отключает SMB шару
+        Отключает SMB шару, если она была подключена этим скриптом
         
         Args:
             mount_path: Путь к подключенной папке
         """
+        if mount_path not in self.owned_mounts:
+            logger.info(f"SMB шара подключена не скриптом, оставляем ее: {mount_path}")
+            return
+        
         try:
             subprocess.run(['umount', mount_path], check=True)
             logger.info(f"SMB шара отключена: {mount_path}")
         except subprocess.CalledProcessError as e:
             logger.warning(f"Не удалось отключить SMB шару {mount_path}: {e}")
+            return
         except Exception as e:
             logger.warning(f"Ошибка при отключении SMB шары: {e}")
+            return
+        
+        self.owned_mounts.discard(mount_path)
+        self._remove_mount_point(mount_path)
     
-    def process_directory(self, source_path: Path, target_path: Path):
+    @staticmethod
+    def _remove_mount_point(mount_path: str):
+        """
+        Удаляет созданную для подключения пустую папку
+        
+        Args:
+            mount_path: Путь к точке монтирования
+        """
+        try:
+            os.rmdir(mount_path)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить точку монтирования {mount_path}: {e}")
+    
+    def process_directory(self, source_path: Path, target_path: Path, prefetch: bool = False):
         """
         Обрабатывает директорию рекурсивно
         
+        Сначала обходит дерево и составляет список файлов для конвертации
+        (имена назначаются последовательно и детерминированно), затем
+        конвертирует файлы параллельно в пуле процессов.
+        
         Args:
             source_path: Путь к исходной папке
             target_path: Путь к целевой папке на SD карте
+            prefetch: Читать следующие файлы заранее, пока конвертируется
+                      текущий (для сетевых источников)
+        """
+        files = self.collect_files(source_path, target_path)
+        if not files:
+            return
+        pairs = [(input_path, output_path) for input_path, output_path, _ in files]
+        
+        # Конвертация упирается в CPU (ресэмплинг, нормализация), поэтому
+        # выполняется в отдельных процессах. spawn - как и по умолчанию в macOS
+        spawn_context = multiprocessing.get_context("spawn")
+        workers = (os.cpu_count() or 1) * 2
+        # Подробности по каждому файлу воркеры пишут на уровне DEBUG, а итог
+        # по файлу логирует только родительский процесс
+        with ProcessPoolExecutor(max_workers=workers, mp_context=spawn_context) as executor:
+            if prefetch:
+                # Воркер получает пачку файлов и читает их с опережением
+                batches = [files[i:i + CONVERT_CHUNKSIZE]
+                           for i in range(0, len(files), CONVERT_CHUNKSIZE)]
+                results = (success for batch_results in executor.map(_convert_batch, batches)
+                           for success in batch_results)
+            else:
+                results = executor.map(_convert_one, pairs, chunksize=CONVERT_CHUNKSIZE)
+            for (input_path, output_path), success in zip(pairs, results):
+                if success:
+                    logger.info(f"Успешно обработан: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
+                else:
+                    logger.error(f"Ошибка конвертации: {os.path.basename(input_path)}")
+    
+    def collect_files(self, source_path: Path, target_path: Path) -> List[Tuple[str, str, int]]:
         """
-        logger.info(f"Обрабатываем директорию: {source_path}")
+        Обходит дерево папок и собирает WAV файлы для конвертации
         
-        # Создаем целевую папку если не существует
-        target_path.mkdir(parents=True, exist_ok=True)
+        Папки обходятся через очередь (deque) пар (исходная папка, целевая
+        папка), без рекурсии, поэтому глубина дерева не ограничена.
+        Символические ссылки на файлы и папки обходятся как обычные элементы;
+        уже пройденные папки (st_dev, st_ino) пропускаются, поэтому ссылка
+        на родительскую папку не зацикливает обход.
+        Целевые папки создаются сразу, в родительском процессе.
         
+        Args:
+            source_path: Путь к исходной папке
+            target_path: Путь к целевой папке на SD карте
+            
+        Returns:
+            Список (исходный файл, выходной файл, размер исходного файла в байтах)
+        """
+        files = []
+        queue = deque([(source_path, target_path)])
+        
+        # Уже поставленные в очередь папки
         try:
-            # Получаем список элементов в папке
-            items = list(source_path.iterdir())
+            root_stat = os.stat(source_path)
+            visited = {(root_stat.st_dev, root_stat.st_ino)}
+        except OSError:
+            visited = set()
+        
+        while queue:
+            source_dir, target_dir = queue.popleft()
+            logger.info(f"Обрабатываем директорию: {source_dir}")
+            
+            # Создаем целевую папку если не существует
+            target_dir.mkdir(parents=True, exist_ok=True)
+            target_dir_str = str(target_dir)
             
-            # Счетчик для уникальности имен файлов
-            file_counter = 0
+            try:
+                # Получаем список элементов в папке. DirEntry кэширует тип элемента
+                # из чтения каталога, поэтому is_file()/is_dir() делают stat
+                # только для символических ссылок
+                with os.scandir(source_dir) as it:
+                    items = list(it)
+            except PermissionError as e:
+                logger.error(f"Ошибка доступа к папке {source_dir}: {e}")
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка обработки папки {source_dir}: {e}")
+                continue
             
-            for item in items:
-                if item.is_file():
-                    # Обрабатываем файл
-                    if item.suffix.lower() == '.wav':
-                        logger.info(f"Обрабатываем WAV файл: {item.name}")
+            # Уже выданные в целевой папке имена (для уникальности)
+            used_names = set()
+            
+            for entry in items:
+                if entry.is_file():
+                    # Обрабатываем файл (расширение - как Path.suffix: имя ".wav"
+                    # без основы расширением не считается)
+                    if len(entry.name) > 4 and entry.name.lower().endswith('.wav'):
+                        logger.debug(f"Обрабатываем WAV файл: {entry.name}")
                         
-                        # Создаем нормализованное имя файла с уникальным номером
-                        normalized_name = self.normalize_name(item.name, file_counter)
-                        output_file = target_path / normalized_name
+                        # Создаем нормализованное имя файла (номер - только при совпадении)
+                        normalized_name = self.unique_name(self.normalize_name(entry.name), used_names)
                         
-                        # Конвертируем файл
-                        if self.convert_audio_file(str(item), str(output_file)):
-                            logger.info(f"Успешно обработан: {item.name} -> {normalized_name}")
-                            file_counter += 1
-                        else:
-                            logger.error(f"Ошибка конвертации: {item.name}")
+                        # Файл будет сконвертирован в пуле процессов
+                        files.append((entry.path, os.path.join(target_dir_str, normalized_name),
+                                      entry.stat().st_size))
                     else:
-                        logger.info(f"Пропускаем не-WAV файл: {item.name}")
+                        logger.debug(f"Пропускаем не-WAV файл: {entry.name}")
                         
-                elif item.is_dir():
+                elif entry.is_dir():
+                    # Папку, в которой уже были (ссылка на нее или на
+                    # родительскую папку), повторно не обходим
+                    try:
+                        entry_stat = entry.stat()
+                    except OSError as e:
+                        logger.error(f"Ошибка обработки папки {entry.path}: {e}")
+                        continue
+                    key = (entry_stat.st_dev, entry_stat.st_ino)
+                    if key in visited:
+                        logger.info(f"Пропускаем уже обработанную папку: {entry.name}")
+                        continue
+                    visited.add(key)
+                    
                     # Обрабатываем папку
-                    logger.info(f"Обрабатываем папку: {item.name}")
+                    logger.info(f"Обрабатываем папку: {entry.name}")
                     
                     # Создаем нормализованную папку
-                    normalized_folder_name = self.normalize_name(item.name)
-                    normalized_folder = target_path / normalized_folder_name
-                    
-                    # Рекурсивно обрабатываем содержимое папки
-                    self.process_directory(item, normalized_folder)
+                    normalized_folder_name = self.unique_name(self.normalize_name(entry.name),
+                                                              used_names)
                     
-        except PermissionError as e:
-            logger.error(f"Ошибка доступа к папке {source_path}: {e}")
-        except Exception as e:
-            logger.error(f"Ошибка обработки папки {source_path}: {e}")
+                    # Содержимое папки будет обработано при выборке из очереди
+                    queue.append((Path(entry.path), target_dir / normalized_folder_name))
+        
+        return files
     
     def run_automation_with_smb(self, server: str, share: str, source_path: str, 
                                sd_card_path: str, username: str = "", password: str = ""):
@@ -311,7 +647,8 @@ class RolandSP404MacOSAutomation:
             target.mkdir(parents=True, exist_ok=True)
             
             # Обрабатываем исходную папку
-            self.process_directory(full_source_path, target)
+            # Чтение с SMB упирается в сетевые задержки - перекрываем его с конвертацией
+            self.process_directory(full_source_path, target, prefetch=True)
             
             logger.info("Автоматизация завершена успешно!")
             return True
@@ -360,6 +697,365 @@ class RolandSP404MacOSAutomation:
             return False
 
 
+# Конвертируемые WAV читаются и пишутся один раз, поэтому держать их в
+# страничном кэше бессмысленно. Платформы управляют кэшем по-разному:
+# в macOS F_NOCACHE действует только на последующий ввод-вывод через
+# дескриптор (уже закэшированные страницы он не вытесняет), поэтому
+# включается до чтения или записи (_disable_page_cache). В Linux
+# posix_fadvise(DONTNEED) освобождает уже прочитанные страницы, поэтому
+# вызывается после последнего прохода по файлу (_release_page_cache);
+# грязные страницы записи освобождаются только после их сброса на диск.
+
+
+def _disable_page_cache(f):
+    """
+    Отключает кэширование последующего ввода-вывода через дескриптор (macOS)
+    
+    В остальных системах ничего не делает.
+    
+    Args:
+        f: Открытый файловый объект
+    """
+    if sys.platform != "darwin" or fcntl is None:
+        return
+    try:
+        # F_NOCACHE = 48 в macOS (в fcntl есть не во всех версиях Python)
+        fcntl.fcntl(f.fileno(), getattr(fcntl, "F_NOCACHE", 48), 1)
+    except OSError:
+        # Это только подсказка - ошибку можно игнорировать
+        pass
+
+
+def _release_page_cache(f):
+    """
+    Подсказывает ОС, что уже прочитанные страницы файла не нужны (Linux)
+    
+    В macOS ничего не делает: там кэш отключается заранее
+    (_disable_page_cache).
+    
+    Args:
+        f: Открытый файловый объект
+    """
+    if sys.platform == "darwin" or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        # Это только подсказка - ошибку можно игнорировать
+        pass
+
+
+def _read_bytes(path: str) -> Optional[bytes]:
+    """
+    Читает файл целиком в память
+    
+    Args:
+        path: Путь к файлу
+        
+    Returns:
+        Содержимое файла или None, если прочитать не удалось (тогда файл
+        будет открыт напрямую и ошибка попадет в лог конвертации)
+    """
+    try:
+        with open(path, 'rb') as f:
+            _disable_page_cache(f)
+            data = f.read()
+            _release_page_cache(f)
+            return data
+    except OSError:
+        return None
+
+
+def _prefetch(path: str, size: int) -> Optional[bytes]:
+    """
+    Читает файл заранее, если он не больше IN_MEMORY_PREFETCH_LIMIT
+    
+    Args:
+        path: Путь к файлу
+        size: Размер файла в байтах
+        
+    Returns:
+        Содержимое файла или None (крупный файл будет прочитан потоково)
+    """
+    if size > IN_MEMORY_PREFETCH_LIMIT:
+        return None
+    return _read_bytes(path)
+
+
+def _convert_batch(batch: List[Tuple[str, str, int]]) -> List[bool]:
+    """
+    Конвертирует пачку файлов, читая следующие файлы в фоновом потоке
+    
+    Пока текущий файл ресэмплируется, поток уже читает следующие
+    PREFETCH_DEPTH файлов, поэтому сетевые задержки SMB перекрываются
+    с вычислениями. Заранее читаются только файлы до IN_MEMORY_PREFETCH_LIMIT,
+    поэтому воркер держит в памяти не больше (PREFETCH_DEPTH + 1) *
+    IN_MEMORY_PREFETCH_LIMIT байт; крупные файлы конвертируются потоково.
+    
+    Args:
+        batch: Список (исходный файл, выходной файл, размер исходного файла)
+        
+    Returns:
+        Результаты конвертации в порядке файлов
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        pending = deque(reader.submit(_prefetch, input_path, size)
+                        for input_path, _, size in batch[:PREFETCH_DEPTH])
+        for index, (input_path, output_path, _) in enumerate(batch):
+            data = pending.popleft().result()
+            next_index = index + PREFETCH_DEPTH
+            if next_index < len(batch):
+                next_path, _, next_size = batch[next_index]
+                pending.append(reader.submit(_prefetch, next_path, next_size))
+            results.append(_convert_one((input_path, output_path), data))
+    return results
+
+
+def _convert_one(pair: Tuple[str, str], data: Optional[bytes] = None) -> bool:
+    """
+    Конвертирует аудиофайл в формат, поддерживаемый SP-404 MKII
+    
+    Функция уровня модуля, чтобы ее можно было выполнять в процессах-воркерах
+    ProcessPoolExecutor.
+    
+    Args:
+        pair: Кортеж (путь к исходному файлу, путь для сохранения результата)
+        data: Уже прочитанное содержимое исходного файла (если есть)
+        
+    Returns:
+        True если конвертация успешна, False иначе
+    """
+    input_path, output_path = pair
+    try:
+        source_file = io.BytesIO(data) if data is not None else input_path
+        
+        # Файл уже в формате SP-404 MKII - копируем без перекодирования.
+        # sf.info читает только заголовок, а shutil.copyfile копирует данные
+        # средствами ядра (fcopyfile в macOS)
+        info = sf.info(source_file)
+        if (info.format == 'WAV' and info.subtype == 'PCM_16'
+                and info.samplerate in SUPPORTED_SAMPLE_RATES and info.channels in (1, 2)):
+            if data is not None:
+                with open(output_path, 'wb') as f:
+                    f.write(data)
+            else:
+                shutil.copyfile(input_path, output_path)
+            logger.debug(f"Файл уже в нужном формате, скопирован: {output_path}")
+            return True
+        
+        # Проверяем текущие параметры
+        current_channels = info.channels
+        current_sample_rate = info.samplerate
+        
+        logger.debug(f"Исходный файл: {current_sample_rate}Hz, {current_channels}ch")
+        
+        # Выбираем ближайшую поддерживаемую частоту дискретизации
+        # (граница - середина между 44100 и 48000, при равенстве - 44100)
+        target_sample_rate = 48000 if current_sample_rate > 46050 else 44100
+        
+        # Сохраняем стерео, если исходный файл стерео (SP-404 MKII поддерживает стерео)
+        if current_channels > 1:
+            logger.debug(f"Сохраняем стерео ({current_channels} каналов)")
+        
+        converted = False
+        if current_sample_rate != target_sample_rate and AFCONVERT_PATH and data is None:
+            # Ресэмплинг выполняет CoreAudio. Заранее прочитанные (небольшие)
+            # файлы afconvert не отдаем - их пришлось бы сначала записать на диск
+            try:
+                _convert_with_afconvert(input_path, output_path, info.frames,
+                                        current_sample_rate, target_sample_rate)
+                converted = True
+            except Exception as e:
+                logger.warning(f"afconvert не смог конвертировать {input_path}, "
+                               f"используем scipy: {e}")
+        
+        if not converted:
+            if data is not None:
+                source_file.seek(0)
+                source_context = contextlib.nullcontext(source_file)
+            else:
+                source_context = open(input_path, 'rb')
+            
+            # Конвертируем файл блоками, не загружая его целиком
+            with source_context as f:
+                with sf.SoundFile(f) as source:
+                    _convert_streaming(source, output_path, target_sample_rate,
+                                       input_file=f if data is None else None)
+                if data is None:
+                    # Linux: оба прохода по исходнику завершены
+                    _release_page_cache(f)
+        
+        if current_sample_rate != target_sample_rate:
+            logger.debug(f"Изменена частота дискретизации: {current_sample_rate} -> {target_sample_rate}")
+        logger.debug(f"Файл конвертирован: {output_path}")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка конвертации файла {input_path}: {e}")
+        return False
+
+
+def _convert_with_afconvert(input_path: str, output_path: str, source_frames: int,
+                            source_sample_rate: int, target_sample_rate: int):
+    """
+    Конвертирует файл через afconvert (CoreAudio)
+    
+    afconvert ресэмплирует во временный float32 WAV (максимальное качество
+    SRC), а нормализация и запись в 16-bit выполняются потоково, как и без
+    afconvert: сам afconvert не умеет нормализовать по пику, а float32 нужен,
+    чтобы после ресэмплинга не обрезались пики. Это одна дополнительная запись
+    на локальный диск (вдвое больше 16-bit исходника) на каждый файл.
+    
+    Длина результата сверяется с тем, что дал бы resample_poly; если она
+    сильно отличается, выбрасывается исключение и файл конвертируется без
+    afconvert.
+    
+    Args:
+        input_path: Путь к исходному файлу
+        output_path: Путь для сохранения конвертированного файла
+        source_frames: Число кадров исходного файла
+        source_sample_rate: Частота дискретизации исходного файла
+        target_sample_rate: Целевая частота дискретизации
+    """
+    # Ожидаемая длина - как у resample_poly (округление вверх)
+    expected_frames = -(-source_frames * target_sample_rate // source_sample_rate)
+    tolerance = max(AFCONVERT_FRAME_TOLERANCE, expected_frames // 1000)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        resampled_path = os.path.join(temp_dir, "resampled.wav")
+        result = subprocess.run([
+            AFCONVERT_PATH, "-f", "WAVE", "-d", f"LEF32@{target_sample_rate}",
+            "--src-complexity", "bats", "-r", "127",
+            input_path, resampled_path
+        ], capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"afconvert: {result.stderr.decode(errors='replace').strip()}")
+        
+        with sf.SoundFile(resampled_path) as resampled:
+            if abs(resampled.frames - expected_frames) > tolerance:
+                raise RuntimeError(f"afconvert вернул {resampled.frames} кадров "
+                                   f"вместо ~{expected_frames}")
+            # Лишние кадры в конце (если есть) отбрасываем, чтобы длина
+            # совпадала с конвертацией без afconvert
+            _convert_streaming(resampled, output_path, target_sample_rate,
+                               frames=min(resampled.frames, expected_frames))
+
+
+def _convert_streaming(source: "sf.SoundFile", output_path: str, target_sample_rate: int,
+                       frames: int = -1, input_file: Optional[BinaryIO] = None):
+    """
+    Конвертирует открытый файл блоками
+    
+    Первый проход находит пиковую амплитуду уже ресэмплированного сигнала
+    (у ресэмплированного пик может быть выше исходного), второй -
+    ресэмплирует блоки (PolyphaseResampler), масштабирует и записывает их в
+    16-bit, поэтому в памяти находится только один блок.
+    
+    Args:
+        source: Открытый исходный файл
+        output_path: Путь для сохранения конвертированного файла
+        target_sample_rate: Целевая частота дискретизации
+        frames: Сколько кадров исходного файла конвертировать (-1 - все)
+        input_file: Файл на диске, из которого читает source (если есть): перед
+            вторым проходом для него отключается страничный кэш
+    """
+    # Полифазный ресэмплинг: для 44.1 <-> 48 kHz это отношение 147/160.
+    # Длина выхода считается по числу конвертируемых кадров.
+    # Ресэмплер хранит состояние, поэтому на каждый проход нужен новый
+    total_frames = source.frames if frames < 0 else min(frames, source.frames)
+    
+    def make_resampler():
+        if source.samplerate == target_sample_rate:
+            return None
+        g = math.gcd(source.samplerate, target_sample_rate)
+        return PolyphaseResampler(target_sample_rate // g, source.samplerate // g,
+                                  total_frames)
+    
+    # Первый проход: пиковая амплитуда для нормализации. Пик берется
+    # после ресэмплинга, иначе выбросы фильтра могут дать клиппинг
+    peak = 0.0
+    resampler = make_resampler()
+    for block in source.blocks(blocksize=BLOCK_SIZE, dtype='float32', frames=frames):
+        if resampler is not None:
+            block = resampler.process(block)
+        if len(block):
+            peak = max(peak, float(np.abs(block).max()))
+    if resampler is not None:
+        tail = resampler.flush()
+        if len(tail):
+            peak = max(peak, float(np.abs(tail).max()))
+    
+    # Нормализуем данные для 16-bit, оставляя небольшой запас
+    scale = np.float32(0.95 * 32767 / peak if peak > 0 else 32767.0)
+    
+    # Второй проход: ресэмплинг, масштабирование и запись в 16-bit
+    source.seek(0)
+    resampler = make_resampler()
+    if input_file is not None:
+        # macOS: первый проход читал исходник через кэш (он нужен второму
+        # проходу), второй проход - последний, его кэшировать незачем
+        _disable_page_cache(input_file)
+    # libsndfile пишет небольшими порциями, поэтому запись идет через
+    # большой буфер - на SD карту уходят крупные блоки
+    with open(output_path, 'w+b', buffering=WRITE_BUFFER_SIZE) as f:
+        _disable_page_cache(f)
+        with sf.SoundFile(f, 'w', samplerate=target_sample_rate, channels=source.channels,
+                          subtype='PCM_16', format='WAV') as output:
+            for block in source.blocks(blocksize=BLOCK_SIZE, dtype='float32', frames=frames):
+                if resampler is not None:
+                    block = resampler.process(block)
+                _write_scaled(output, block, scale)
+            
+            if resampler is not None:
+                # Забираем хвост, оставшийся в буфере ресэмплера
+                tail = resampler.flush()
+                if len(tail):
+                    _write_scaled(output, tail, scale)
+        
+        # Linux: записанные страницы больше не нужны в кэше
+        f.flush()
+        _release_page_cache(f)
+
+
+def _write_scaled(output: "sf.SoundFile", block: "np.ndarray", scale: "np.float32"):
+    """
+    Масштабирует блок float32 и записывает его в 16-bit
+    
+    Масштабирование, ограничение диапазона и приведение к int16 выполняются
+    за один проход (_quantize_i16).
+    
+    Args:
+        output: Открытый выходной файл
+        block: Блок отсчетов float32 (может быть изменен на месте)
+        scale: Коэффициент масштабирования до диапазона int16
+    """
+    block_16bit = _int16_buffer(block.shape)
+    _quantize_i16(block.reshape(-1), scale, block_16bit.reshape(-1))
+    output.write(block_16bit)
+
+
+# Буфер для блоков int16: переиспользуется между блоками и файлами воркера
+# (конвертация в процессе-воркере идет в одном потоке)
+_int16_storage = None
+
+
+def _int16_buffer(shape: Tuple[int, ...]) -> "np.ndarray":
+    """
+    Возвращает буфер int16 нужной формы (содержимое не инициализировано)
+    
+    Args:
+        shape: Форма буфера
+        
+    Returns:
+        Массив-представление поверх общего буфера
+    """
+    global _int16_storage
+    size = int(np.prod(shape))
+    if _int16_storage is None or _int16_storage.size < size:
+        _int16_storage = np.empty(size, dtype=np.int16)
+    return _int16_storage[:size].reshape(shape)
+
 def main():
     """Основная функция"""
     print("Roland SP-404 MKII macOS File Automation")